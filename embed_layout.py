@@ -0,0 +1,166 @@
+"""
+Discordのメッセージ・Embed上限に合わせてコンテンツを詰めるためのユーティリティ
+"""
+
+# 1メッセージあたりの本文の上限
+MAX_MESSAGE_LENGTH = 2000
+# 1メッセージあたりのEmbed数の上限
+MAX_EMBEDS_PER_MESSAGE = 10
+# 1メッセージ内の全Embedの合計文字数の上限
+MAX_EMBED_TOTAL_LENGTH = 6000
+# Embedの説明文の上限
+MAX_DESCRIPTION_LENGTH = 4096
+# 1Embedあたりのフィールド数の上限
+MAX_FIELDS_PER_EMBED = 25
+# フィールド名・値の上限
+MAX_FIELD_NAME_LENGTH = 256
+MAX_FIELD_VALUE_LENGTH = 1024
+
+# コードブロックの区切り
+CODE_FENCE = '```'
+
+
+def truncate(text, limit, suffix='...'):
+    """上限を超える文字列を末尾を省略して上限以内に収める"""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - len(suffix), 0)] + suffix
+
+
+def _toggles_fence(line):
+    """行がコードブロックを開く・閉じる区切りならTrue（1行で開閉している場合は除く）"""
+    return line.lstrip().startswith(CODE_FENCE) and line.count(CODE_FENCE) % 2 == 1
+
+
+def split_text(text, limit=MAX_MESSAGE_LENGTH):
+    """
+    長いテキストを上限以内のかたまりに分割
+
+    できるだけ行の区切りで分割し、1行が上限を超える場合だけ行の途中で分割する。
+    コードブロックの途中で分割する場合は、かたまりの末尾で閉じて次のかたまりの先頭で開き直す。
+
+    Args:
+        text (str): 分割するテキスト
+        limit (int): 1かたまりあたりの最大文字数
+
+    Returns:
+        list: 文字列のリスト（空のテキストなら空リスト）
+    """
+    if not text:
+        return []
+    if len(text) <= limit:
+        return [text]
+
+    closing = '\n' + CODE_FENCE
+    chunks = []
+    # 現在のかたまりの行と、改行込みの文字数
+    buffer = []
+    length = 0
+    # 開いているコードブロックの開始行（開いていなければNone）
+    fence = None
+
+    def flush():
+        nonlocal buffer, length
+        if fence is not None:
+            buffer.append(CODE_FENCE)
+        chunks.append('\n'.join(buffer))
+        buffer = [fence] if fence is not None else []
+        length = len(fence) if fence is not None else 0
+
+    for line in text.split('\n'):
+        # 開き直し・閉じる分を除いても収まらない行は行の途中で分割する
+        overhead = len(fence) + 1 + len(closing) if fence is not None else 0
+        room = max(limit - overhead, 1)
+        pieces = [line[i:i + room] for i in range(0, len(line), room)] if len(line) > room else [line]
+
+        for piece in pieces:
+            after = fence
+            if _toggles_fence(piece):
+                after = None if fence is not None else piece.strip()
+            new_length = length + (1 if buffer else 0) + len(piece)
+            reserve = len(closing) if after is not None else 0
+            if buffer and new_length + reserve > limit:
+                flush()
+                new_length = length + (1 if buffer else 0) + len(piece)
+            buffer.append(piece)
+            length = new_length
+            fence = after
+
+    if buffer:
+        if fence is not None:
+            buffer.append(CODE_FENCE)
+        chunks.append('\n'.join(buffer))
+    return chunks
+
+
+def pack_fields(fields, max_fields=MAX_FIELDS_PER_EMBED, max_total=MAX_EMBED_TOTAL_LENGTH, reserved=0):
+    """
+    フィールドをEmbed単位にまとめる
+
+    順序を保ったまま、1Embedあたりのフィールド数と合計文字数の上限に収まるように詰める。
+    フィールド名・値はそれぞれの上限を超える分を省略する。
+
+    Args:
+        fields (list): (フィールド名, 値) のリスト
+        max_fields (int): 1Embedあたりの最大フィールド数
+        max_total (int): 1Embedあたりの合計文字数の上限
+        reserved (int): タイトル・説明文・フッターなどフィールド以外に使う文字数
+
+    Returns:
+        list: 1Embed分の (フィールド名, 値) リストのリスト
+    """
+    budget = max_total - reserved
+    groups = []
+    current = []
+    current_length = 0
+
+    for name, value in fields:
+        name = truncate(name, MAX_FIELD_NAME_LENGTH)
+        value = truncate(value, MAX_FIELD_VALUE_LENGTH)
+        length = len(name) + len(value)
+        if current and (len(current) >= max_fields or current_length + length > budget):
+            groups.append(current)
+            current = []
+            current_length = 0
+        current.append((name, value))
+        current_length += length
+
+    if current:
+        groups.append(current)
+
+    return groups
+
+
+def pack_embeds(embeds, max_embeds=MAX_EMBEDS_PER_MESSAGE, max_total=MAX_EMBED_TOTAL_LENGTH):
+    """
+    Embedを送信メッセージ単位にまとめる
+
+    順序を保ったまま、1メッセージあたりの個数と合計文字数の上限に収まるように詰める。
+    単体で上限を超えるEmbedはそれだけで1メッセージにする。
+
+    Args:
+        embeds (list): discord.Embed のリスト
+        max_embeds (int): 1メッセージあたりの最大Embed数
+        max_total (int): 1メッセージあたりの合計文字数の上限
+
+    Returns:
+        list: 1メッセージ分のEmbedリストのリスト
+    """
+    batches = []
+    current = []
+    current_length = 0
+
+    for embed in embeds:
+        length = len(embed)
+        if current and (len(current) >= max_embeds or current_length + length > max_total):
+            batches.append(current)
+            current = []
+            current_length = 0
+        current.append(embed)
+        current_length += length
+
+    if current:
+        batches.append(current)
+
+    return batches
@@ -0,0 +1,91 @@
+"""
+/random_graphary 用の事前生成Embedプール
+バックグラウンドで作成済みのEmbedを溜めておき、コマンド実行時に即座に返す
+"""
+
+from collections import deque
+
+
+class RandomEmbedPool:
+    def __init__(self, size=5, low_water=2):
+        """
+        プールを初期化
+
+        Args:
+            size (int): 補充時に溜めておくEmbedの数（0で無効）
+            low_water (int): この数を下回ったら補充する
+        """
+        self.size = size
+        self.low_water = min(low_water, size)
+        # (数式ID, Embed) のキュー
+        self._entries = deque()
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def take(self):
+        """
+        作成済みのEmbedを1つ取り出す
+
+        Returns:
+            discord.Embed: Embed（プールが空ならNone）
+        """
+        if not self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        _, embed = self._entries.popleft()
+        return embed
+
+    def needs_refill(self):
+        """補充が必要ならTrue（low_waterを下回った時）"""
+        return self.enabled and len(self._entries) < max(self.low_water, 1)
+
+    async def refill(self, build):
+        """
+        プールをsizeまで補充
+
+        Args:
+            build: (数式ID, Embed) を返すコルーチン関数（取得できなければNone）
+
+        Returns:
+            int: 追加したEmbedの数
+        """
+        added = 0
+        while len(self._entries) < self.size:
+            entry = await build()
+            if entry is None:
+                break
+            self._entries.append(entry)
+            added += 1
+        return added
+
+    def discard(self, formula_id):
+        """数式が更新・削除された時に、その数式のEmbedを破棄"""
+        before = len(self._entries)
+        self._entries = deque(entry for entry in self._entries if entry[0] != formula_id)
+        self.invalidations += before - len(self._entries)
+
+    def clear(self):
+        """全てのEmbedを破棄"""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self):
+        """メトリクスを文字列で取得"""
+        total = self.hits + self.misses
+        hit_rate = f"{self.hits / total * 100:.0f}%" if total else "-"
+        return (
+            f"在庫: {len(self._entries)}/{self.size} | "
+            f"ヒット: {self.hits} | ミス: {self.misses} ({hit_rate}) | "
+            f"破棄: {self.invalidations}"
+        )
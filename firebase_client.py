@@ -1,17 +1,87 @@
 """
 Firebase Firestore クライアント
 今日登録された数式データを取得する機能を提供
+（AsyncClientを使用し、全メソッドはコルーチンとして呼び出す）
 """
 
 import os
 import json
+import asyncio
+import inspect
+import random
+import time
 from datetime import datetime, timezone, timedelta
 from google.cloud import firestore
 from google.oauth2 import service_account
+from formula_mirror import FormulaMirror
+from search_index import FormulaSearchIndex
+from tag_index import TagIndex
+
+# 接続ヘルスチェックの間隔（秒）
+HEALTH_CHECK_INTERVAL = 300
+
+# ランダム選択用IDキャッシュの差分更新間隔（秒）
+RANDOM_ID_REFRESH_INTERVAL = 60
+# ランダム選択用IDキャッシュの全件再読込間隔（秒）
+RANDOM_ID_FULL_RELOAD_INTERVAL = 24 * 60 * 60
+
+# タグ辞書の再読込間隔（秒）
+TAG_CACHE_TTL = 600
+
+# 日付範囲で数式を読み込む時の1ページあたりの件数
+FORMULA_PAGE_SIZE = 20
+
+# IDキャッシュ・検索インデックス用に読み込むフィールド
+CATALOG_FIELDS = ['timestamp', 'title', 'title_EN', 'tags', 'formula_type']
+
+# ミラーの初期ロード待ちのタイムアウト（秒）
+MIRROR_READY_TIMEOUT = 60
+
+def get_today_start_utc():
+    """今日の数式として扱う範囲の開始時刻（日本時間で前日0時）をUTCで取得"""
+    jst = timezone(timedelta(hours=9))
+    now_jst = datetime.now(jst)
+    yesterday_start = (now_jst - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return yesterday_start.astimezone(timezone.utc)
 
 class FirebaseClient:
     def __init__(self):
-        """Firebase Firestore クライアントを初期化"""
+        """
+        Firebase Firestore クライアントを初期化
+
+        Botプロセス全体で1つのインスタンスを共有する想定。
+        実際の接続（認証情報の解析・gRPCチャネル生成）は最初のアクセス時に遅延して行う。
+        """
+        self._db = None
+        self._credentials = None
+        self._project_id = None
+        self._last_health_check = 0.0
+        
+        # items コレクションのローカルミラー（start_mirrorで有効化）
+        self.mirror = None
+        self._mirror_started_at = 0.0
+        self._mirror_listeners = []
+        
+        # タイトル・タグ・数式タイプの検索インデックス
+        self.search_index = FormulaSearchIndex()
+        
+        # ランダム選択用のドキュメントIDキャッシュ
+        self._formula_ids = []
+        self._formula_id_index = {}
+        self._formula_ids_latest = None
+        self._formula_ids_loaded_at = 0.0
+        self._formula_ids_refreshed_at = 0.0
+        
+        # タグID -> タグ情報 の辞書（tagsListを一括で読み込んでキャッシュ）
+        self._tags = {}
+        self._tags_loaded_at = 0.0
+        self._tags_lock = asyncio.Lock()
+        # タグ名の検索インデックス（タグ辞書が読み直されたら作り直す）
+        self._tag_index = None
+        self._tag_index_source = None
+    
+    def _connect(self):
+        """認証情報を読み込んでFirestoreクライアントを生成"""
         # 環境変数からサービスアカウント情報を取得
         firebase_credentials = os.getenv('FIREBASE_CREDENTIALS')
         if not firebase_credentials:
@@ -20,14 +90,170 @@ class FirebaseClient:
         try:
             # JSON文字列をパース
             credentials_dict = json.loads(firebase_credentials)
-            credentials = service_account.Credentials.from_service_account_info(credentials_dict)
+            self._credentials = service_account.Credentials.from_service_account_info(credentials_dict)
+            self._project_id = credentials_dict['project_id']
             
-            # Firestoreクライアントを初期化
-            self.db = firestore.Client(credentials=credentials, project=credentials_dict['project_id'])
+            # Firestoreクライアントを初期化（asyncio版。イベントループをブロックしない）
+            self._db = firestore.AsyncClient(credentials=self._credentials, project=self._project_id)
+            self._last_health_check = time.monotonic()
         except Exception as e:
             raise ValueError(f"Firebase認証エラー: {e}")
     
-    def get_today_formulas(self):
+    @property
+    def db(self):
+        """Firestoreクライアント（未接続なら接続する）"""
+        if self._db is None:
+            self._connect()
+        return self._db
+    
+    async def _ping(self):
+        """疎通確認（selectでIDだけを1件読み、ドキュメント本体は転送しない）"""
+        await self.db.collection('items').select([]).limit(1).get()
+    
+    async def check_health(self, force=False):
+        """
+        接続状態を確認し、異常があれば再接続する
+        
+        Args:
+            force (bool): 前回の確認時刻に関係なく確認する
+            
+        Returns:
+            bool: 接続が正常ならTrue
+        """
+        if self._db is not None and not force:
+            if time.monotonic() - self._last_health_check < HEALTH_CHECK_INTERVAL:
+                return True
+        
+        await self._check_mirror()
+        
+        try:
+            await self._ping()
+            self._last_health_check = time.monotonic()
+            return True
+        except Exception as e:
+            print(f"Firebase接続確認エラー: {e}")
+        
+        # 一度だけ再接続を試みる
+        try:
+            await self.reconnect()
+            await self._ping()
+            return True
+        except Exception as e:
+            print(f"Firebase再接続エラー: {e}")
+            self._mark_unhealthy()
+            return False
+    
+    async def reconnect(self):
+        """既存のチャネルを破棄して接続し直す"""
+        await self.close()
+        self._connect()
+    
+    async def close(self):
+        """Firestoreクライアントのチャネルを閉じる"""
+        if self._db is None:
+            return
+        try:
+            if hasattr(self._db, 'close'):
+                result = self._db.close()
+                if inspect.isawaitable(result):
+                    await result
+        except Exception as e:
+            print(f"Firebaseクローズエラー: {e}")
+        finally:
+            self._db = None
+    
+    def _mark_unhealthy(self):
+        """次回アクセス時にヘルスチェックを強制する"""
+        self._last_health_check = 0.0
+    
+    async def start_mirror(self, timeout=MIRROR_READY_TIMEOUT):
+        """
+        items コレクションのローカルミラーを開始し、初期ロードを待つ
+        
+        スナップショットリスナーは同期版クライアントでしか使えないため、
+        ミラー専用に同期版の firestore.Client を生成する。
+        
+        Args:
+            timeout (float): 初期ロード待ちのタイムアウト（秒）
+            
+        Returns:
+            bool: 初期ロードが完了していればTrue
+        """
+        if self._credentials is None:
+            self._connect()
+        
+        await self.stop_mirror()
+        
+        # 停止中に削除されたドキュメントが残らないよう、検索インデックスはミラーのスナップショットから作り直す
+        # （初期ロードが終わるまでの直接クエリでは全件を読み直させる）
+        self.search_index = FormulaSearchIndex()
+        self._formula_ids = []
+        self._formula_id_index = {}
+        
+        # 検索インデックスにタグ名を入れるため、先にタグ辞書を読み込んでおく
+        await self.get_tag_map()
+        
+        sync_db = firestore.Client(credentials=self._credentials, project=self._project_id)
+        self.mirror = FormulaMirror(sync_db)
+        self.mirror.add_listener(self._on_mirror_change)
+        for callback in self._mirror_listeners:
+            self.mirror.add_listener(callback)
+        self._mirror_started_at = time.monotonic()
+        self.mirror.start()
+        
+        ready = await asyncio.to_thread(self.mirror.wait_until_ready, timeout)
+        if ready:
+            print(f"数式ミラーの初期ロード完了: {len(self.mirror)}件")
+        else:
+            print("数式ミラーの初期ロードがタイムアウトしました。直接クエリで応答します。")
+        return ready
+    
+    async def stop_mirror(self):
+        """ローカルミラーを停止"""
+        if self.mirror is None:
+            return
+        mirror = self.mirror
+        self.mirror = None
+        # リスナースレッドの終了を待つため、イベントループの外で停止する
+        await asyncio.to_thread(mirror.stop)
+    
+    def add_mirror_listener(self, callback):
+        """
+        ミラーの変更通知コールバックを登録（ミラー再開後も引き継がれる）
+        
+        Args:
+            callback: callback(doc_id, data) の形でリスナースレッドから呼ばれる
+        """
+        self._mirror_listeners.append(callback)
+        if self.mirror is not None:
+            self.mirror.add_listener(callback)
+    
+    def _on_mirror_change(self, doc_id, data):
+        """ミラーの変更を検索インデックスに反映"""
+        if data is None:
+            self.search_index.remove(doc_id)
+        else:
+            self.search_index.update(doc_id, data, self._cached_tag_names(data.get('tags') or []))
+    
+    @property
+    def mirror_healthy(self):
+        """ミラーが有効かつ正常に同期しているならTrue"""
+        return self.mirror is not None and self.mirror.healthy
+    
+    async def _check_mirror(self):
+        """ミラーのリスナーが停止していれば再開する"""
+        if self.mirror is None or self.mirror.healthy:
+            return
+        # 初期ロード中は待つ
+        if time.monotonic() - self._mirror_started_at < MIRROR_READY_TIMEOUT:
+            return
+        print("数式ミラーのリスナーが停止しているため再開します。")
+        try:
+            await self.start_mirror()
+        except Exception as e:
+            print(f"数式ミラー再開エラー: {e}")
+    
+    async def get_today_formulas(self):
         """
         今日登録された数式データを取得
         
@@ -35,66 +261,336 @@ class FirebaseClient:
             list: 今日の数式データのリスト
         """
         try:
-            # 日本時間で今日の開始時刻と終了時刻を計算
-            jst = timezone(timedelta(hours=9))
-            now_jst = datetime.now(jst)
-            yesterday_start = (now_jst - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-
-            # UTC時間に変換
-            today_start_utc = yesterday_start.astimezone(timezone.utc)
+            return await self.get_formulas_since(get_today_start_utc())
+        except Exception as e:
+            print(f"Firebase取得エラー: {e}")
+            return []
+    
+    async def get_formulas_since(self, start):
+        """
+        指定時刻以降に登録された数式データを新しい順に取得
+        
+        Args:
+            start (datetime): 開始時刻（この時刻を含む）
             
-            # Firestoreクエリ（timestampが今日の範囲内）
+        Returns:
+            list: 数式データのリスト
+            
+        Raises:
+            Exception: Firestoreの取得に失敗した場合
+        """
+        results = []
+        async for page in self.iter_formulas_since(start):
+            results.extend(page)
+        return results
+    
+    async def get_formulas_between(self, start, end, exclude=None):
+        """
+        start <= 登録時刻 < end の数式データを新しい順に取得
+        
+        先にIDと登録時刻だけを読み（selectによる射影）、exclude で除外されなかった数式だけ本体を読み込む。
+        
+        Args:
+            start (datetime): 開始時刻（この時刻を含む）
+            end (datetime): 終了時刻（この時刻を含まない）
+            exclude: exclude(doc_id) が真のドキュメントは読み込まない
+            
+        Returns:
+            list: 数式データのリスト
+            
+        Raises:
+            Exception: Firestoreの取得に失敗した場合
+        """
+        if self.mirror_healthy:
+            return [
+                data for data in self.mirror.since(start)
+                if data.get('timestamp') < end and not (exclude and exclude(data['id']))
+            ]
+        
+        try:
+            await self.check_health()
+            query = (
+                self.db.collection('items')
+                .where('timestamp', '>=', start)
+                .where('timestamp', '<', end)
+                .order_by('timestamp', direction=firestore.Query.DESCENDING)
+            )
+            doc_ids = [
+                data['id'] async for data in self.stream_fields(query, ['timestamp'])
+                if not (exclude and exclude(data['id']))
+            ]
             items_ref = self.db.collection('items')
-            query = items_ref.where('timestamp', '>=', today_start_utc)
+            formulas = []
+            for doc_id in doc_ids:
+                doc = await items_ref.document(doc_id).get()
+                if doc.exists:
+                    data = doc.to_dict()
+                    data['id'] = doc.id
+                    data['update_time'] = doc.update_time
+                    formulas.append(data)
+            return formulas
+        except Exception:
+            self._mark_unhealthy()
+            raise
+    
+    async def iter_formulas_since(self, start, page_size=FORMULA_PAGE_SIZE):
+        """
+        指定時刻以降に登録された数式データを新しい順にページ単位で取得
+        
+        Firestore側で timestamp の降順に並べ、start_after カーソルで次のページを読み込む。
+        
+        Args:
+            start (datetime): 開始時刻（この時刻を含む）
+            page_size (int): 1ページあたりの件数
+            
+        Yields:
+            list: 数式データのリスト（1ページ分）
             
-            results = []
-            for doc in query.stream():
+        Raises:
+            Exception: Firestoreの取得に失敗した場合
+        """
+        # ミラーが正常ならメモリ上のインデックスから返す
+        if self.mirror_healthy:
+            formulas = self.mirror.since(start)
+            for i in range(0, len(formulas), page_size):
+                yield formulas[i:i + page_size]
+            return
+        
+        # Firestoreクエリ（timestampが開始時刻以降、新しい順）
+        query = (
+            self.db.collection('items')
+            .where('timestamp', '>=', start)
+            .order_by('timestamp', direction=firestore.Query.DESCENDING)
+            .limit(page_size)
+        )
+        
+        last_doc = None
+        while True:
+            page_query = query.start_after(last_doc) if last_doc else query
+            try:
+                await self.check_health()
+                docs = [doc async for doc in page_query.stream()]
+            except Exception:
+                self._mark_unhealthy()
+                raise
+            
+            if not docs:
+                return
+            
+            page = []
+            for doc in docs:
                 data = doc.to_dict()
                 data['id'] = doc.id
-                results.append(data)
+                data['update_time'] = doc.update_time
+                page.append(data)
+            yield page
             
-            # timestampでソート（新しい順）
-            results.sort(key=lambda x: x.get('timestamp', datetime.min.replace(tzinfo=timezone.utc)), reverse=True)
+            if len(docs) < page_size:
+                return
+            last_doc = docs[-1]
+    
+    async def count_today_formulas(self):
+        """
+        今日登録された数式の件数を取得（ドキュメント本体は読み込まない）
+        
+        Returns:
+            int: 件数
             
-            return results
+        Raises:
+            Exception: Firestoreの取得に失敗した場合
+        """
+        return await self.count_formulas_since(get_today_start_utc())
+    
+    async def count_formulas_since(self, start):
+        """
+        指定時刻以降に登録された数式の件数を取得
+        
+        Args:
+            start (datetime): 開始時刻（この時刻を含む）
             
-        except Exception as e:
-            print(f"Firebase取得エラー: {e}")
-            return []
+        Returns:
+            int: 件数
+            
+        Raises:
+            Exception: Firestoreの取得に失敗した場合
+        """
+        if self.mirror_healthy:
+            return self.mirror.count_since(start)
+        
+        try:
+            await self.check_health()
+            return await self.count(self.db.collection('items').where('timestamp', '>=', start))
+        except Exception:
+            self._mark_unhealthy()
+            raise
+    
+    async def count(self, query):
+        """
+        集計クエリ count() で件数だけを取得
+        
+        Args:
+            query: Firestoreのクエリまたはコレクション参照
+            
+        Returns:
+            int: 件数
+        """
+        results = await query.count(alias='count').get()
+        return int(results[0][0].value)
     
-    def get_random_formula(self):
+    async def stream_fields(self, query, fields):
+        """
+        指定フィールドだけを読み込んでドキュメントを列挙（selectによる射影）
+        
+        Args:
+            query: Firestoreのクエリまたはコレクション参照
+            fields (list): 読み込むフィールド名（空リストならIDのみ）
+            
+        Yields:
+            dict: 指定フィールドと 'id' を含むデータ
+        """
+        async for doc in query.select(fields).stream():
+            data = doc.to_dict() or {}
+            data['id'] = doc.id
+            yield data
+    
+    async def get_random_formula(self):
         """
         Firestoreからランダムに1つの数式を取得
         
+        キャッシュしたドキュメントIDから1件選び、そのドキュメントだけを読み込む。
+        
         Returns:
             dict: ランダムな数式データ、エラー時はNone
         """
         try:
-            # 全ての数式を取得してからランダムに選択
-            # より効率的な方法もあるが、データ量が少ない場合はこの方法で十分
-            items_ref = self.db.collection('items')
+            # ミラーが正常ならメモリ上から選ぶ
+            if self.mirror_healthy:
+                return self.mirror.random()
             
-            # 全ドキュメントを取得
-            all_docs = []
-            for doc in items_ref.stream():
-                data = doc.to_dict()
-                data['id'] = doc.id
-                all_docs.append(data)
+            await self.check_health()
+            await self._refresh_formula_ids()
             
-            if not all_docs:
-                return None
+            items_ref = self.db.collection('items')
             
-            # ランダムに1つ選択
-            import random
-            random_formula = random.choice(all_docs)
+            # 削除済みのIDを引いた場合はキャッシュから外して選び直す
+            for _ in range(3):
+                if not self._formula_ids:
+                    return None
+                
+                doc_id = random.choice(self._formula_ids)
+                doc = await items_ref.document(doc_id).get()
+                if doc.exists:
+                    data = doc.to_dict()
+                    data['id'] = doc.id
+                    data['update_time'] = doc.update_time
+                    return data
+                
+                self._discard_formula_id(doc_id)
             
-            return random_formula
+            return None
             
         except Exception as e:
             print(f"ランダム数式取得エラー: {e}")
+            self._mark_unhealthy()
             return None
     
-    def get_tag_name(self, tag_id):
+    async def _refresh_formula_ids(self):
+        """
+        ランダム選択用のIDキャッシュと検索インデックスを更新
+        
+        初回と一定時間ごとに全件（CATALOG_FIELDSのみ）を読み込み、
+        それ以外は前回以降に追加されたドキュメントだけを取得する。
+        """
+        now = time.monotonic()
+        items_ref = self.db.collection('items')
+        
+        if not self._formula_ids or now - self._formula_ids_loaded_at > RANDOM_ID_FULL_RELOAD_INTERVAL:
+            # 全件再読込（途中で失敗しても既存のキャッシュは壊さない）
+            tag_map = await self.get_tag_map()
+            ids = []
+            latest = None
+            async for data in self.stream_fields(items_ref, CATALOG_FIELDS):
+                ids.append(data['id'])
+                self.search_index.update(data['id'], data, self._cached_tag_names(data.get('tags') or [], tag_map))
+                timestamp = data.get('timestamp')
+                if timestamp and (latest is None or timestamp > latest):
+                    latest = timestamp
+            
+            # 削除されたドキュメントを検索インデックスから外す
+            for doc_id in set(self._formula_ids) - set(ids):
+                self.search_index.remove(doc_id)
+            
+            self._formula_ids = ids
+            self._formula_id_index = {doc_id: i for i, doc_id in enumerate(ids)}
+            self._formula_ids_latest = latest
+            self._formula_ids_loaded_at = now
+            self._formula_ids_refreshed_at = now
+            return
+        
+        if now - self._formula_ids_refreshed_at < RANDOM_ID_REFRESH_INTERVAL or not self._formula_ids_latest:
+            return
+        
+        # 前回以降に追加されたドキュメントだけを取得
+        tag_map = await self.get_tag_map()
+        query = items_ref.where('timestamp', '>', self._formula_ids_latest)
+        async for data in self.stream_fields(query, CATALOG_FIELDS):
+            self._add_formula_id(data['id'])
+            self.search_index.update(data['id'], data, self._cached_tag_names(data.get('tags') or [], tag_map))
+            timestamp = data.get('timestamp')
+            if timestamp and timestamp > self._formula_ids_latest:
+                self._formula_ids_latest = timestamp
+        
+        self._formula_ids_refreshed_at = now
+    
+    def _add_formula_id(self, doc_id):
+        """IDキャッシュにドキュメントIDを追加"""
+        if doc_id in self._formula_id_index:
+            return
+        self._formula_id_index[doc_id] = len(self._formula_ids)
+        self._formula_ids.append(doc_id)
+    
+    def _discard_formula_id(self, doc_id):
+        """IDキャッシュからドキュメントIDを削除（末尾と入れ替えてO(1)で削除）"""
+        self.search_index.remove(doc_id)
+        index = self._formula_id_index.pop(doc_id, None)
+        if index is None:
+            return
+        last_id = self._formula_ids.pop()
+        if last_id != doc_id:
+            self._formula_ids[index] = last_id
+            self._formula_id_index[last_id] = index
+    
+    async def get_tag_map(self):
+        """
+        タグID -> タグ情報 の辞書を取得
+        
+        tagsListコレクションを1回のクエリでまとめて読み込み、TAG_CACHE_TTL秒の間は再利用する。
+        再読込に失敗した場合は前回の辞書をそのまま返す。
+        
+        Returns:
+            dict: {タグID: {'tagName': ..., 'tagName_EN': ...}}
+        """
+        if self._tags and time.monotonic() - self._tags_loaded_at < TAG_CACHE_TTL:
+            return self._tags
+        
+        async with self._tags_lock:
+            # 待っている間に他のタスクが読み込んだ場合はそれを使う
+            if self._tags and time.monotonic() - self._tags_loaded_at < TAG_CACHE_TTL:
+                return self._tags
+            
+            try:
+                tags = {}
+                async for doc in self.db.collection('tagsList').stream():
+                    tags[doc.id] = doc.to_dict()
+                self._tags = tags
+                self._tags_loaded_at = time.monotonic()
+            except Exception as e:
+                print(f"タグ一覧取得エラー: {e}")
+                self._mark_unhealthy()
+        
+        return self._tags
+    
+    async def get_tag_name(self, tag_id):
         """
         タグIDからタグ名を取得
         
@@ -104,20 +600,98 @@ class FirebaseClient:
         Returns:
             dict: タグ情報（tagName, tagName_EN）
         """
+        tag_map = await self.get_tag_map()
+        return tag_map.get(str(tag_id), {'tagName': tag_id, 'tagName_EN': tag_id})
+    
+    async def get_tag_names(self, tag_ids):
+        """
+        複数のタグIDをまとめてタグ名に変換
+        
+        Args:
+            tag_ids (list): タグIDのリスト
+            
+        Returns:
+            list: タグ名のリスト（見つからないIDはそのまま）
+        """
+        tag_map = await self.get_tag_map()
+        return self._cached_tag_names(tag_ids, tag_map)
+    
+    async def get_tag_index(self):
+        """
+        タグ名の検索インデックスを取得（オートコンプリート用）
+        
+        Returns:
+            TagIndex: tagsListコレクションのタグを索引化したもの
+        """
+        tag_map = await self.get_tag_map()
+        if self._tag_index is None or self._tag_index_source is not tag_map:
+            self._tag_index = TagIndex(
+                {'tagID': tag_id, **tag_info} for tag_id, tag_info in tag_map.items()
+            )
+            self._tag_index_source = tag_map
+        return self._tag_index
+    
+    def _cached_tag_names(self, tag_ids, tag_map=None):
+        """読み込み済みのタグ辞書だけを使ってタグ名に変換（通信しない）"""
+        if tag_map is None:
+            tag_map = self._tags
+        tag_names = []
+        for tag_id in tag_ids:
+            tag_info = tag_map.get(str(tag_id))
+            tag_names.append(tag_info.get('tagName', tag_id) if tag_info else tag_id)
+        return tag_names
+    
+    async def search_formulas(self, query, limit=100, tag_id=None):
+        """
+        タイトル・英語タイトル・タグ名・数式タイプから数式を検索
+        
+        Args:
+            query (str): 検索クエリ（タグIDを指定する場合は空でもよい）
+            limit (int): 最大件数
+            tag_id (str): 絞り込むタグID
+            
+        Returns:
+            list: 一致したドキュメントIDのリスト（スコア順）
+        """
         try:
-            doc_ref = self.db.collection('tagsList').document(tag_id)
-            doc = doc_ref.get()
+            # ミラーが動いていればインデックスはリスナーで更新済み
+            if not self.mirror_healthy:
+                await self.check_health()
+                await self._refresh_formula_ids()
+            return self.search_index.search(query, limit, tag_id=tag_id)
+        except Exception as e:
+            print(f"数式検索エラー: {e}")
+            self._mark_unhealthy()
+            return []
+    
+    async def get_formula(self, doc_id):
+        """
+        ドキュメントIDから数式データを取得
+        
+        Args:
+            doc_id (str): ドキュメントID
             
-            if doc.exists:
-                return doc.to_dict()
-            else:
-                return {'tagName': tag_id, 'tagName_EN': tag_id}
-                
+        Returns:
+            dict: 数式データ、存在しない場合やエラー時はNone
+        """
+        try:
+            if self.mirror_healthy:
+                return self.mirror.get(doc_id)
+            
+            doc = await self.db.collection('items').document(doc_id).get()
+            if not doc.exists:
+                self._discard_formula_id(doc_id)
+                return None
+            data = doc.to_dict()
+            data['id'] = doc.id
+            data['update_time'] = doc.update_time
+            return data
         except Exception as e:
-            print(f"タグ取得エラー: {e}")
-            return {'tagName': tag_id, 'tagName_EN': tag_id}
+            print(f"数式取得エラー: {e}")
+            self._mark_unhealthy()
+            return None
     
-    def format_formula_for_discord(self, formula_data):
+    async def format_formula_for_discord(self, formula_data):
         """
         数式データをDiscord用のEmbed形式に変換
         
@@ -131,9 +705,7 @@ class FirebaseClient:
             # タグ情報を取得
             tag_names = []
             if 'tags' in formula_data and formula_data['tags']:
-                for tag_id in formula_data['tags']:
-                    tag_info = self.get_tag_name(tag_id)
-                    tag_names.append(tag_info.get('tagName', tag_id))
+                tag_names = await self.get_tag_names(formula_data['tags'])
             
             # 数式タイプの処理
             formula_types = formula_data.get('formula_type', [])
@@ -165,7 +737,8 @@ class FirebaseClient:
                 'tags': ', '.join(tag_names) if tag_names else 'なし',
                 'image_url': formula_data.get('image_url', ''),
                 'timestamp': timestamp_str,
-                'id': formula_data.get('id', '')
+                'id': formula_data.get('id', ''),
+                'update_time': formula_data.get('update_time')
             }
             
         except Exception as e:
@@ -0,0 +1,232 @@
+"""
+Firestore items コレクションのローカルミラー
+スナップショットリスナーで変更を受け取り、メモリ上のインデックスを常に最新に保つ
+"""
+
+import bisect
+import random
+import threading
+import time
+
+
+class FormulaMirror:
+    def __init__(self, db):
+        """
+        ミラーを初期化
+
+        Args:
+            db: 同期版の firestore.Client（on_snapshotはAsyncClientでは使えないため）
+        """
+        self._db = db
+        self._watch = None
+        # リスナーはFirestoreのバックグラウンドスレッドから呼ばれるためロックで保護する
+        self._lock = threading.RLock()
+        self._ready = threading.Event()
+        self._error = None
+        self._last_event_at = 0.0
+        self._listeners = []
+
+        # ドキュメントID -> データ
+        self._docs = {}
+        # ランダム選択用のIDリストと位置
+        self._ids = []
+        self._id_index = {}
+        # (timestamp, id) の昇順リスト
+        self._by_timestamp = []
+        # タグID -> ドキュメントIDの集合
+        self._by_tag = {}
+        # 数式タイプ -> ドキュメントIDの集合
+        self._by_type = {}
+
+    def start(self):
+        """スナップショットリスナーを開始（最初のスナップショットが全件の初期ロードになる）"""
+        self._ready.clear()
+        self._error = None
+        self._watch = self._db.collection('items').on_snapshot(self._on_snapshot)
+
+    def stop(self):
+        """スナップショットリスナーを停止し、クライアントを閉じる"""
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception as e:
+                print(f"ミラー停止エラー: {e}")
+            finally:
+                self._watch = None
+        try:
+            self._db.close()
+        except Exception as e:
+            print(f"ミラー用クライアントのクローズエラー: {e}")
+
+    def wait_until_ready(self, timeout=None):
+        """
+        初期ロードの完了を待つ（ブロッキング）
+
+        Returns:
+            bool: 初期ロードが完了していればTrue
+        """
+        return self._ready.wait(timeout)
+
+    @property
+    def healthy(self):
+        """初期ロード済みで、リスナーが動作中ならTrue"""
+        if self._watch is None or self._error is not None or not self._ready.is_set():
+            return False
+        return bool(getattr(self._watch, 'is_active', True))
+
+    @property
+    def last_event_at(self):
+        """最後にスナップショットを受信した時刻（time.monotonic）"""
+        return self._last_event_at
+
+    def add_listener(self, callback):
+        """
+        変更通知のコールバックを登録
+
+        Args:
+            callback: callback(doc_id, data) の形で呼ばれる。削除時の data は None。
+                      リスナースレッドから呼ばれるため、asyncio側の処理は
+                      loop.call_soon_threadsafe などで受け渡すこと。
+        """
+        self._listeners.append(callback)
+
+    def _on_snapshot(self, docs, changes, read_time):
+        """スナップショットの差分をインデックスに反映"""
+        try:
+            applied = []
+            with self._lock:
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == 'REMOVED':
+                        self._remove(doc.id)
+                        applied.append((doc.id, None))
+                    else:
+                        data = doc.to_dict() or {}
+                        data['id'] = doc.id
+                        data['update_time'] = getattr(doc, 'update_time', None)
+                        self._remove(doc.id)
+                        self._add(doc.id, data)
+                        applied.append((doc.id, data))
+                self._last_event_at = time.monotonic()
+            self._ready.set()
+
+            for doc_id, data in applied:
+                for callback in self._listeners:
+                    try:
+                        callback(doc_id, data)
+                    except Exception as e:
+                        print(f"ミラー通知エラー: {e}")
+        except Exception as e:
+            print(f"ミラー更新エラー: {e}")
+            self._error = e
+
+    def _add(self, doc_id, data):
+        """インデックスにドキュメントを追加（ロック取得済みで呼ぶこと）"""
+        self._docs[doc_id] = data
+
+        self._id_index[doc_id] = len(self._ids)
+        self._ids.append(doc_id)
+
+        timestamp = data.get('timestamp')
+        if timestamp:
+            bisect.insort(self._by_timestamp, (timestamp, doc_id))
+
+        for tag_id in data.get('tags') or []:
+            self._by_tag.setdefault(str(tag_id), set()).add(doc_id)
+
+        for formula_type in self._formula_types(data):
+            self._by_type.setdefault(formula_type, set()).add(doc_id)
+
+    def _remove(self, doc_id):
+        """インデックスからドキュメントを削除（ロック取得済みで呼ぶこと）"""
+        data = self._docs.pop(doc_id, None)
+        if data is None:
+            return
+
+        # 末尾と入れ替えてO(1)で削除
+        index = self._id_index.pop(doc_id)
+        last_id = self._ids.pop()
+        if last_id != doc_id:
+            self._ids[index] = last_id
+            self._id_index[last_id] = index
+
+        timestamp = data.get('timestamp')
+        if timestamp:
+            position = bisect.bisect_left(self._by_timestamp, (timestamp, doc_id))
+            if position < len(self._by_timestamp) and self._by_timestamp[position] == (timestamp, doc_id):
+                del self._by_timestamp[position]
+
+        for tag_id in data.get('tags') or []:
+            ids = self._by_tag.get(str(tag_id))
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._by_tag[str(tag_id)]
+
+        for formula_type in self._formula_types(data):
+            ids = self._by_type.get(formula_type)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._by_type[formula_type]
+
+    @staticmethod
+    def _formula_types(data):
+        """formula_type をリストとして取得（文字列の場合はカンマ区切り）"""
+        formula_types = data.get('formula_type') or []
+        if isinstance(formula_types, str):
+            formula_types = [t.strip() for t in formula_types.split(',') if t.strip()]
+        return formula_types
+
+    # --- 読み取り ---
+
+    def __len__(self):
+        return len(self._docs)
+
+    def get(self, doc_id):
+        """ドキュメントIDから数式データを取得"""
+        with self._lock:
+            data = self._docs.get(doc_id)
+            return dict(data) if data else None
+
+    def all(self):
+        """全ての数式データを取得"""
+        with self._lock:
+            return [dict(data) for data in self._docs.values()]
+
+    def since(self, start):
+        """
+        指定時刻以降の数式データを新しい順に取得
+
+        Args:
+            start (datetime): 開始時刻（タイムゾーン付き）
+
+        Returns:
+            list: 数式データのリスト
+        """
+        with self._lock:
+            position = bisect.bisect_left(self._by_timestamp, (start, ''))
+            entries = self._by_timestamp[position:]
+            return [dict(self._docs[doc_id]) for _, doc_id in reversed(entries)]
+
+    def count_since(self, start):
+        """指定時刻以降の数式の件数を取得"""
+        with self._lock:
+            return len(self._by_timestamp) - bisect.bisect_left(self._by_timestamp, (start, ''))
+
+    def random(self):
+        """ランダムに1つの数式データを取得（空の場合はNone）"""
+        with self._lock:
+            if not self._ids:
+                return None
+            return dict(self._docs[random.choice(self._ids)])
+
+    def ids_by_tag(self, tag_id):
+        """タグIDが付いたドキュメントIDの集合を取得"""
+        with self._lock:
+            return set(self._by_tag.get(str(tag_id), ()))
+
+    def ids_by_type(self, formula_type):
+        """数式タイプに該当するドキュメントIDの集合を取得"""
+        with self._lock:
+            return set(self._by_type.get(formula_type, ()))
@@ -0,0 +1,111 @@
+"""
+数式Embedのレンダラー
+通知・ランダム表示・検索結果で共通のEmbedを作成し、数式の更新時刻ごとにキャッシュする
+"""
+
+from collections import OrderedDict
+
+import discord
+
+EMBED_COLOR = 0x00FF7F
+FOOTER_TEXT = "Graph + Library = Graphary"
+GRAPHARY_URL = "https://teth-main.github.io/Graphary/?formulaId={}"
+
+# キャッシュするEmbedの最大数
+CACHE_SIZE = 256
+
+# (数式ID, 更新時刻, タグ) -> Embed辞書
+_cache = OrderedDict()
+_hits = 0
+_misses = 0
+
+
+def _cache_key(formatted_data):
+    """キャッシュキーを作成（更新時刻が無い場合は表示内容そのものをキーにする）"""
+    update_time = formatted_data.get('update_time')
+    if update_time is None:
+        return tuple(formatted_data.get(k, '') for k in ('id', 'title', 'formula', 'formula_type', 'tags', 'image_url'))
+    # タグ名は数式とは別に変わりうるのでキーに含める
+    return (formatted_data.get('id', ''), update_time, formatted_data.get('tags', ''))
+
+
+def _build_embed_dict(formatted_data):
+    """フォーマット済みの数式データからEmbed辞書を作成"""
+    embed_dict = {
+        'type': 'rich',
+        'title': formatted_data['title'],
+        'description': f"```\n{formatted_data['formula']}\n```",
+        'color': EMBED_COLOR,
+        'url': GRAPHARY_URL.format(formatted_data['id']),
+        'fields': [],
+        'footer': {'text': FOOTER_TEXT},
+    }
+
+    # 数式タイプを追加
+    if formatted_data['formula_type']:
+        type_list = "\n".join(f"`{t}`" for t in formatted_data['formula_type'].split(', '))
+        embed_dict['fields'].append({'name': "数式タイプ", 'value': type_list, 'inline': True})
+
+    # タグを追加
+    if formatted_data['tags'] and formatted_data['tags'] != 'なし':
+        tag_list = "\n".join(f"`{t}`" for t in formatted_data['tags'].split(', '))
+        embed_dict['fields'].append({'name': "タグ", 'value': tag_list, 'inline': True})
+
+    # 画像を設定（大きく表示）
+    if formatted_data['image_url']:
+        embed_dict['image'] = {'url': formatted_data['image_url']}
+
+    return embed_dict
+
+
+def render_formula_embed_dict(formatted_data):
+    """
+    数式のEmbed辞書を取得（キャッシュ済みならそれを返す）
+
+    返り値はキャッシュと共有しているため変更しないこと。
+
+    Args:
+        formatted_data (dict): FirebaseClient.format_formula_for_discord の結果
+
+    Returns:
+        dict: Embed辞書
+    """
+    global _hits, _misses
+
+    key = _cache_key(formatted_data)
+    embed_dict = _cache.get(key)
+    if embed_dict is not None:
+        _cache.move_to_end(key)
+        _hits += 1
+        return embed_dict
+
+    _misses += 1
+    embed_dict = _build_embed_dict(formatted_data)
+    _cache[key] = embed_dict
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return embed_dict
+
+
+def create_formula_embed(formatted_data):
+    """
+    フォーマット済みの数式データから通知と同じスタイルのEmbedを作成
+
+    Args:
+        formatted_data (dict): FirebaseClient.format_formula_for_discord の結果
+
+    Returns:
+        discord.Embed: 数式のEmbed（呼び出し側で変更してよい）
+    """
+    embed_dict = render_formula_embed_dict(formatted_data)
+    # Embed.from_dict はリストをそのまま参照するため、変更されうる部分だけ複製する
+    return discord.Embed.from_dict({
+        **embed_dict,
+        'fields': [dict(field) for field in embed_dict['fields']],
+        'footer': dict(embed_dict['footer']),
+    })
+
+
+def cache_stats():
+    """キャッシュの状況を文字列で取得"""
+    return f"キャッシュ: {len(_cache)}/{CACHE_SIZE} | ヒット: {_hits} | ミス: {_misses}"
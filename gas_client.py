@@ -7,16 +7,39 @@ import os
 import aiohttp
 import json
 from typing import List, Dict, Optional
+from embed_layout import MAX_FIELD_VALUE_LENGTH
+from http_session import create_http_session
+from tag_catalog import TagCatalog
 
 class GASClient:
-    def __init__(self):
-        """GAS クライアントを初期化"""
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        """
+        GAS クライアントを初期化
+        
+        Args:
+            session: 共有するHTTPセッション（省略時は初回リクエストで専用のセッションを作成）
+        """
         self.gas_url = os.getenv('GAS_WEBAPP_URL')
         if not self.gas_url:
             raise ValueError("GAS_WEBAPP_URL環境変数が設定されていません")
         
         # スプレッドシートID（main.gsで使用されているもの）
         self.spreadsheet_id = '139qGcw2VXJRZF_zBLJ-wL-Lh8--hHZEFd0I1YYVsnqM'
+        
+        self.session = session
+        self._owns_session = False
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """HTTPセッションを取得（共有セッションが無ければ作成）"""
+        if self.session is None or self.session.closed:
+            self.session = create_http_session()
+            self._owns_session = True
+        return self.session
+    
+    async def close(self):
+        """自分で作成したHTTPセッションを閉じる（共有セッションは閉じない）"""
+        if self._owns_session and self.session and not self.session.closed:
+            await self.session.close()
     
     async def get_tags_list(self) -> List[Dict]:
         """
@@ -31,23 +54,23 @@ class GASClient:
                 'name': 'tagsList'
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.gas_url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if isinstance(data, list):
-                            return data
-                        else:
-                            print(f"タグリスト取得エラー: 予期しないデータ形式 - {data}")
-                            return []
+            session = self._get_session()
+            async with session.get(self.gas_url, params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if isinstance(data, list):
+                        return data
                     else:
-                        print(f"タグリスト取得エラー: HTTP {response.status}")
+                        print(f"タグリスト取得エラー: 予期しないデータ形式 - {data}")
                         return []
+                else:
+                    print(f"タグリスト取得エラー: HTTP {response.status}")
+                    return []
         except Exception as e:
             print(f"タグリスト取得エラー: {e}")
             return []
     
-    async def register_formula(self, formula_data: Dict) -> Dict:
+    async def register_formula(self, formula_data: Dict, request_id: Optional[str] = None) -> Dict:
         """
         数式を登録
         
@@ -59,115 +82,137 @@ class GASClient:
                 - formula_type: 数式タイプ（カンマ区切り文字列）
                 - tags: 既存タグIDのカンマ区切り文字列
                 - image_url: 画像URL
+            request_id: 申請ごとの一意なキー（同じキーの再送はGAS側で二重登録されない）
                 
         Returns:
             dict: 登録結果 {'success': bool, 'result': dict or 'error': str}
         """
-        try:
-            # POSTデータを準備（main.gsのregisterFormula関数に合わせる）
-            post_data = {
-                'type': 'formula',
-                'title': formula_data.get('title', ''),
-                'title_EN': formula_data.get('title_EN', ''),
-                'formula': formula_data.get('formula', ''),
-                'formula_type': formula_data.get('formula_type', ''),
-                'tags': formula_data.get('tags', ''),
-                'image_url': formula_data.get('image_url', '')
-            }
+        # POSTデータを準備（main.gsのregisterFormula関数に合わせる）
+        post_data = {
+            'type': 'formula',
+            **self._formula_payload(formula_data)
+        }
+        if request_id:
+            post_data['requestId'] = request_id
+        
+        return await self._post(post_data)
+    
+    async def register_formulas(self, formulas: List[Dict], request_ids: Optional[List[str]] = None) -> Dict:
+        """
+        複数の数式をまとめてGAS経由で登録（1回のリクエスト・1回のシート書き込み）
+        
+        Args:
+            formulas: 数式データのリスト（各要素は register_formula と同じ形式）
+            request_ids: 各数式の申請キーのリスト（formulasと同じ順番）
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.gas_url,
-                    headers={'Content-Type': 'application/json'},
-                    data=json.dumps(post_data)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        return {
-                            'success': False,
-                            'error': f'HTTP {response.status}: {error_text}'
-                        }
+        Returns:
+            dict: 登録結果 {'success': bool, 'result': list or 'error': str}
+                  resultは各数式の {'success': bool, 'result': dict or 'error': str}（formulasと同じ順番）
+        """
+        items = []
+        for i, formula_data in enumerate(formulas):
+            item = self._formula_payload(formula_data)
+            if request_ids and request_ids[i]:
+                item['requestId'] = request_ids[i]
+            items.append(item)
+        
+        # main.gsのregisterFormulasBatch関数に合わせる
+        return await self._post({
+            'type': 'formulas_batch',
+            'formulas': items
+        })
+    
+    @staticmethod
+    def _formula_payload(formula_data: Dict) -> Dict:
+        """数式データからGASに送る項目を取り出す"""
+        return {
+            'title': formula_data.get('title', ''),
+            'title_EN': formula_data.get('title_EN', ''),
+            'formula': formula_data.get('formula', ''),
+            'formula_type': formula_data.get('formula_type', ''),
+            'tags': formula_data.get('tags', ''),
+            'image_url': formula_data.get('image_url', '')
+        }
+    
+    async def _post(self, post_data: Dict) -> Dict:
+        """
+        GASにPOSTリクエストを送信
+        
+        Returns:
+            dict: GASの応答 {'success': bool, 'result': ... or 'error': str}
+        """
+        try:
+            session = self._get_session()
+            async with session.post(
+                self.gas_url,
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps(post_data)
+            ) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return result
+                else:
+                    error_text = await response.text()
+                    return {
+                        'success': False,
+                        'error': f'HTTP {response.status}: {error_text}'
+                    }
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
     
-    def format_tags_for_display(self, tags_data: List[Dict], max_per_line: int = 6) -> str:
+    def format_tags_for_display(self, tags_data, max_per_line: int = 6) -> str:
         """
         タグリストを表示用にフォーマット
         
         Args:
-            tags_data: タグデータのリスト
+            tags_data: タグカタログ（またはタグデータのリスト）
             max_per_line: 1行あたりの最大タグ数
             
         Returns:
             str: フォーマットされたタグリスト文字列
         """
-        if not tags_data:
-            return "利用可能なタグがありません。"
-        
-        lines = []
-        current_line = []
+        return TagCatalog.of(tags_data).format_for_display(max_per_line)
+    
+    def format_tags_pages(self, tags_data, limit: int = MAX_FIELD_VALUE_LENGTH, max_per_line: int = 6) -> list:
+        """
+        タグリストをEmbedの上限に収まるかたまりに分けて表示用にフォーマット
         
-        for i, tag in enumerate(tags_data, 1):
-            tag_name = tag.get('tagName', f"Tag{i}")
-            tag_display = f"`{i}. {tag_name}`"
-            current_line.append(tag_display)
+        Args:
+            tags_data: タグカタログ（またはタグデータのリスト）
+            limit: 1かたまりあたりの最大文字数
+            max_per_line: 1行あたりの最大タグ数
             
-            if len(current_line) >= max_per_line:
-                lines.append(' '.join(current_line))
-                current_line = []
-        
-        # 残りのタグがあれば追加
-        if current_line:
-            lines.append(' '.join(current_line))
-        
-        return '\n'.join(lines)
+        Returns:
+            list: フォーマットされたタグリスト文字列のリスト
+        """
+        return TagCatalog.of(tags_data).format_pages(limit, max_per_line)
     
-    def parse_tag_selection(self, tags_data: List[Dict], user_input: str) -> str:
+    def parse_tag_selection(self, tags_data, user_input: str) -> str:
         """
-        ユーザーの数字入力をタグIDに変換
+        ユーザーの入力をタグIDに変換
         
         Args:
-            tags_data: タグデータのリスト
-            user_input: ユーザーの入力（例: "1, 3, 5"）
+            tags_data: タグカタログ（またはタグデータのリスト）
+            user_input: ユーザーの入力（例: "1, 3, 5"、範囲指定 "1-5, 9"、タグ名も可）
             
         Returns:
             str: タグIDのカンマ区切り文字列（例: "tag1,tag3,tag5"）
         """
-        if not user_input or user_input.lower().strip() == 'なし':
-            return ''
-        
         try:
-            # 入力をカンマで分割して数字を取得
-            numbers = [int(num.strip()) for num in user_input.split(',') if num.strip().isdigit()]
-            
-            # 有効な範囲の数字のみフィルタ
-            valid_numbers = [num for num in numbers if 1 <= num <= len(tags_data)]
-            
-            # 対応するタグIDを取得
-            tag_ids = []
-            for num in valid_numbers:
-                tag = tags_data[num - 1]  # 1-based indexing
-                tag_id = tag.get('tagID', str(num))
-                tag_ids.append(str(tag_id))
-            
-            return ','.join(tag_ids)
-            
+            return ','.join(TagCatalog.of(tags_data).parse_selection(user_input))
         except Exception as e:
             print(f"タグ選択解析エラー: {e}")
             return ''
     
-    def get_selected_tag_names(self, tags_data: List[Dict], tag_ids_str: str) -> List[str]:
+    def get_selected_tag_names(self, tags_data, tag_ids_str: str) -> List[str]:
         """
         タグIDからタグ名のリストを取得
         
         Args:
-            tags_data: タグデータのリスト
+            tags_data: タグカタログ（またはタグデータのリスト）
             tag_ids_str: タグIDのカンマ区切り文字列
             
         Returns:
@@ -177,16 +222,4 @@ class GASClient:
             return []
         
         tag_ids = [tid.strip() for tid in tag_ids_str.split(',') if tid.strip()]
-        tag_names = []
-        
-        for tag_id in tag_ids:
-            # タグIDからタグ名を検索
-            for tag in tags_data:
-                if str(tag.get('tagID', '')) == tag_id:
-                    tag_names.append(tag.get('tagName', tag_id))
-                    break
-            else:
-                # 見つからない場合はIDをそのまま使用
-                tag_names.append(tag_id)
-        
-        return tag_names
+        return TagCatalog.of(tags_data).names(tag_ids)
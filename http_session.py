@@ -0,0 +1,35 @@
+"""
+Bot全体で共有するHTTPセッション
+Google Apps Script などへの接続をコネクションプールとKeep-Aliveで使い回す
+"""
+
+import aiohttp
+
+# 同時接続数の上限（全体 / 1ホストあたり）
+CONNECTION_LIMIT = 20
+CONNECTION_LIMIT_PER_HOST = 10
+# アイドル接続を保持する秒数
+KEEPALIVE_TIMEOUT = 60
+# DNSキャッシュの保持秒数
+DNS_CACHE_TTL = 300
+
+# Apps Script は応答が遅いことがあるため全体は長め、接続確立は短めにする
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_connect=10)
+
+
+def create_http_session():
+    """
+    コネクションプール付きのHTTPセッションを作成
+
+    イベントループ上で呼び出し、使い終わったら close() すること。
+
+    Returns:
+        aiohttp.ClientSession: HTTPセッション
+    """
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=DNS_CACHE_TTL,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=DEFAULT_TIMEOUT)
@@ -25,6 +25,9 @@ function doPost(e) {
       case 'formula':
         result = registerFormula(data);
         break;
+      case 'formulas_batch':
+        result = registerFormulasBatch(data);
+        break;
       case 'report':
         result = registerReport(data);
         break;
@@ -56,38 +59,31 @@ function doPost(e) {
  * @return {Object} 登録結果
  */
 function registerFormula(data) {
+  // registerFormulasBatch と同じロックで、最終行の読み取りから書き込みまでを他の登録と重ならないようにする
+  // （重複チェックもロック内で行い、処理中の同じ申請を二重登録しない）
+  const lock = LockService.getScriptLock();
+  lock.waitLock(30000);
   try {
     Logger.log("Starting formula registration");
     
+    // Bot側の再送で同じ申請が届いた場合は前回の結果を返す（二重登録防止）
+    const cache = CacheService.getScriptCache();
+    const cacheKey = data.requestId ? 'formula:' + data.requestId : null;
+    if (cacheKey) {
+      const cached = cache.get(cacheKey);
+      if (cached) {
+        Logger.log("Duplicate request: " + data.requestId);
+        return JSON.parse(cached);
+      }
+    }
+    
     const spreadsheetId = '139qGcw2VXJRZF_zBLJ-wL-Lh8--hHZEFd0I1YYVsnqM'; // スプレッドシートのID
     const ss = SpreadsheetApp.openById(spreadsheetId);
     
     Logger.log("Spreadsheet opened successfully");
     
     // 新しいタグがあれば先に登録して、IDを取得する
-    let tagIds = [];
-    
-    // 既存のタグIDを配列に変換
-    if (data.tags && data.tags.trim() !== '') {
-      tagIds = data.tags.split(',').filter(id => id.trim() !== '');
-      Logger.log("Existing tag IDs: " + tagIds.join(', '));
-    }
-    
-    // 新しいタグがあれば登録してIDを取得
-    if (data.newTags && data.newTags.trim() !== '') {
-      Logger.log("Processing new tags: " + data.newTags);
-      const newTagsArray = data.newTags.split(',').filter(tag => tag.trim() !== '');
-      if (newTagsArray.length > 0) {
-        // 新しいタグを登録してIDを取得
-        const newTagIds = registerNewTags(newTagsArray, ss);
-        Logger.log("New tag IDs registered: " + newTagIds.join(', '));
-        // 既存のタグIDと新しいタグIDを結合
-        tagIds = tagIds.concat(newTagIds);
-      }
-    }
-    
-    // タグIDをカンマ区切り文字列に変換
-    const finalTagIds = tagIds.join(',');
+    const finalTagIds = resolveTagIds(data, ss);
     Logger.log("Final tag IDs: " + finalTagIds);
     
     // データシートを取得 - シート名を "inputData" に変更
@@ -124,14 +120,142 @@ function registerFormula(data) {
     dataSheet.appendRow(row);
     Logger.log("Row inserted successfully");
     
-    return { 
+    const result = { 
       id: newId,
       tagIds: finalTagIds // タグIDも返す
     };
+    if (cacheKey) {
+      cache.put(cacheKey, JSON.stringify(result), 21600); // 6時間（CacheServiceの上限）
+    }
+    return result;
   } catch (error) {
     Logger.log("Error in registerFormula: " + error.toString());
     Logger.log("Stack trace: " + error.stack);
     throw error;
+  } finally {
+    lock.releaseLock();
+  }
+}
+
+/**
+ * 既存のタグIDと新しいタグ（あれば登録）をまとめてタグIDのカンマ区切り文字列にする
+ * @param {Object} data - 数式データ（tags, newTags）
+ * @param {Spreadsheet} ss - スプレッドシート
+ * @return {string} タグIDのカンマ区切り文字列
+ */
+function resolveTagIds(data, ss) {
+  let tagIds = [];
+  
+  // 既存のタグIDを配列に変換
+  if (data.tags && data.tags.trim() !== '') {
+    tagIds = data.tags.split(',').filter(id => id.trim() !== '');
+    Logger.log("Existing tag IDs: " + tagIds.join(', '));
+  }
+  
+  // 新しいタグがあれば登録してIDを取得
+  if (data.newTags && data.newTags.trim() !== '') {
+    Logger.log("Processing new tags: " + data.newTags);
+    const newTagsArray = data.newTags.split(',').filter(tag => tag.trim() !== '');
+    if (newTagsArray.length > 0) {
+      // 新しいタグを登録してIDを取得
+      const newTagIds = registerNewTags(newTagsArray, ss);
+      Logger.log("New tag IDs registered: " + newTagIds.join(', '));
+      // 既存のタグIDと新しいタグIDを結合
+      tagIds = tagIds.concat(newTagIds);
+    }
+  }
+  
+  return tagIds.join(',');
+}
+
+/**
+ * 複数の数式をまとめて登録する（スプレッドシートを1回だけ開き、1回のsetValuesで書き込む）
+ * 1件ごとのエラーはその数式の結果として返し、他の数式の登録は続ける
+ * @param {Object} data - { formulas: 数式データの配列 }（各要素は registerFormula と同じ形式）
+ * @return {Array} 各数式の登録結果 { success, result } または { success: false, error }（入力と同じ順番）
+ */
+function registerFormulasBatch(data) {
+  const formulas = data.formulas || [];
+  Logger.log("Starting batch formula registration: " + formulas.length + " formulas");
+  if (formulas.length === 0) {
+    return [];
+  }
+  
+  // 行番号からIDを決めるため、同時に書き込まれないようロックする
+  const lock = LockService.getScriptLock();
+  lock.waitLock(30000);
+  try {
+    // 再送された申請は前回の結果を返す（二重登録防止）
+    const cache = CacheService.getScriptCache();
+    const cacheKeys = formulas
+      .filter(formula => formula.requestId)
+      .map(formula => 'formula:' + formula.requestId);
+    const cached = cacheKeys.length > 0 ? cache.getAll(cacheKeys) : {};
+    
+    const spreadsheetId = '139qGcw2VXJRZF_zBLJ-wL-Lh8--hHZEFd0I1YYVsnqM'; // スプレッドシートのID
+    const ss = SpreadsheetApp.openById(spreadsheetId);
+    
+    const dataSheet = ss.getSheetByName('inputData');
+    if (!dataSheet) {
+      Logger.log("inputData sheet not found!");
+      throw new Error('inputDataシートが見つかりません');
+    }
+    
+    const lastRow = dataSheet.getLastRow();
+    const now = new Date();
+    const rows = [];
+    const results = [];
+    const toCache = {};
+    
+    formulas.forEach(formula => {
+      const cacheKey = formula.requestId ? 'formula:' + formula.requestId : null;
+      if (cacheKey && cached[cacheKey]) {
+        Logger.log("Duplicate request: " + formula.requestId);
+        results.push({ success: true, result: JSON.parse(cached[cacheKey]) });
+        return;
+      }
+      
+      try {
+        // IDは行番号（ヘッダー行を含む）
+        const newId = lastRow + rows.length + 1;
+        const finalTagIds = resolveTagIds(formula, ss);
+        rows.push([
+          newId, // ID
+          formula.title || '', // タイトル
+          formula.title_EN || '', // 英語タイトル
+          formula.formula || '', // 数式
+          formula.formula_type || '', // 数式タイプ
+          finalTagIds, // タグID（既存 + 新規）
+          formula.image_url || '', // 画像URL
+          now // 登録日時
+        ]);
+        
+        const result = { id: newId, tagIds: finalTagIds };
+        results.push({ success: true, result: result });
+        if (cacheKey) {
+          toCache[cacheKey] = JSON.stringify(result);
+        }
+      } catch (error) {
+        Logger.log("Error in batch item " + (formula.requestId || '') + ": " + error.toString());
+        results.push({ success: false, error: error.toString() });
+      }
+    });
+    
+    if (rows.length > 0) {
+      dataSheet.getRange(lastRow + 1, 1, rows.length, rows[0].length).setValues(rows);
+      Logger.log("Inserted " + rows.length + " rows");
+    }
+    if (Object.keys(toCache).length > 0) {
+      cache.putAll(toCache, 21600); // 6時間（CacheServiceの上限）
+    }
+    
+    return results;
+  } catch (error) {
+    Logger.log("Error in registerFormulasBatch: " + error.toString());
+    Logger.log("Stack trace: " + error.stack);
+    throw error;
+  } finally {
+    lock.releaseLock();
   }
 }
 
@@ -1,16 +1,41 @@
 import os
+import asyncio
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import logging
-from datetime import time, timezone, timedelta
-from messages_gspread import get_message, get_all_messages
-from firebase_client import FirebaseClient
+import uuid
+from datetime import datetime, time, timezone, timedelta
+import messages_gspread
+from message_cache import MessageTemplateCache
+from firebase_client import FirebaseClient, get_today_start_utc
 from gas_client import GASClient
+from http_session import create_http_session
+from tag_cache import TagCache
+from tag_index import MAX_CHOICES as MAX_TAG_CHOICES
+from tag_catalog import TagCatalog
+from embed_pool import RandomEmbedPool
+import formula_renderer
+from formula_renderer import create_formula_embed
+from embed_layout import MAX_FIELD_NAME_LENGTH, pack_embeds, pack_fields, split_text, truncate
+from send_scheduler import SendScheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from notification_state import NotificationState
+from registration_outbox import RegistrationOutbox
 
 # ログ設定
 logging.basicConfig(level=logging.INFO)
 
+# 日本時間と定期通知の時刻
+JST = timezone(timedelta(hours=9))
+NOTIFICATION_TIME = time(hour=0, minute=10, tzinfo=JST)
+
+# メッセージテンプレートのローカルストアをシートと同期する間隔（秒）
+MESSAGE_CACHE_RECONCILE_INTERVAL = int(os.getenv('MESSAGE_CACHE_RECONCILE_INTERVAL', '600'))
+
+# 登録申請アウトボックスの送信間隔（秒）と1回にまとめて送る件数
+OUTBOX_DRAIN_INTERVAL = 15
+OUTBOX_BATCH_SIZE = 20
+
 # Intentsの設定
 intents = discord.Intents.default()
 intents.message_content = True
@@ -20,14 +45,103 @@ intents.members = True
 class MyBot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix='!', intents=intents)
+        # プロセス全体で共有するFirebaseクライアント（setup_hookで生成）
+        self.firebase_client = None
+        # 外部APIと共有するHTTPセッション（コネクションプール・Keep-Alive付き、setup_hookで生成）
+        self.http_session = None
+        self._gas_client = None
+        # 数式登録で使うGASのタグリストのキャッシュ
+        self.tag_cache = TagCache(lambda: self.gas_client.get_tags_list())
+        # 数式登録申請の送信待ちキュー（GASへの送信はバックグラウンドで行う）
+        self.registration_outbox = RegistrationOutbox()
+        self._outbox_lock = asyncio.Lock()
+        self._background_tasks = set()
+        # 管理者メッセージ用テンプレートのローカルストア（シートとはバックグラウンドで同期）
+        self.message_cache = MessageTemplateCache()
+        # 全ての送信を優先度・レート制限付きで処理する送信キュー
+        self.sender = SendScheduler()
+        # 数式通知の送信済みウォーターマーク
+        self.notification_state = NotificationState()
+        # /random_graphary 用の事前生成Embedプール
+        self.random_embed_pool = RandomEmbedPool(
+            size=int(os.getenv('RANDOM_EMBED_POOL_SIZE', '5')),
+            low_water=int(os.getenv('RANDOM_EMBED_POOL_LOW_WATER', '2'))
+        )
     
     async def setup_hook(self):
         """Bot起動時のセットアップ"""
+        self.sender.start()
+        self.http_session = create_http_session()
+        # メッセージ管理APIも同じセッションを使う
+        messages_gspread.configure(self.http_session)
+        
+        # Firebaseクライアントを生成（接続は初回アクセス時に遅延して行う）
+        self.firebase_client = FirebaseClient()
+        # 数式が更新・削除されたらプール内の古いEmbedを破棄する
+        self.firebase_client.add_mirror_listener(self._on_formula_changed)
+        
+        # itemsコレクションのローカルミラー（オプトイン）
+        if os.getenv('FIREBASE_MIRROR_ENABLED', '').lower() in ('1', 'true', 'yes'):
+            try:
+                await self.firebase_client.start_mirror()
+            except Exception as e:
+                print(f"数式ミラー開始エラー: {e}")
+        
         await self.tree.sync()
         print(f"Synced commands for {self.user}")
         
         # 定期通知タスクを開始
         self.daily_formula_notification.start()
+        
+        # ランダム表示用Embedプールの補充タスクを開始
+        if self.random_embed_pool.enabled:
+            self.refill_random_embed_pool.start()
+        
+        # 登録申請アウトボックスの送信タスクを開始
+        self.drain_registration_outbox.start()
+        
+        # メッセージテンプレートのシートとの定期同期を開始（初回はすぐに同期する）
+        self.reconcile_message_templates.start()
+    
+    async def close(self):
+        """Bot終了時のクリーンアップ"""
+        # 定期タスクと裏で動いている処理を止めて終わるのを待ってから、それらが使うDB・HTTPセッションを閉じる
+        pending = []
+        for loop in (
+            self.daily_formula_notification,
+            self.refill_random_embed_pool,
+            self.drain_registration_outbox,
+            self.reconcile_message_templates,
+        ):
+            loop.cancel()
+            task = loop.get_task()
+            if task is not None:
+                pending.append(task)
+        for task in list(self._background_tasks):
+            task.cancel()
+            pending.append(task)
+        await asyncio.gather(*pending, return_exceptions=True)
+        await self.message_cache.close()
+        
+        await self.sender.stop()
+        if self.firebase_client:
+            await self.firebase_client.stop_mirror()
+            await self.firebase_client.close()
+        if self.http_session:
+            await self.http_session.close()
+        await asyncio.to_thread(self.registration_outbox.close)
+        await super().close()
+    
+    @property
+    def gas_client(self):
+        """
+        共有HTTPセッションを使うGASクライアントを取得（初回アクセス時に生成）
+        
+        GAS_WEBAPP_URL が未設定の場合は ValueError を送出する。
+        """
+        if self._gas_client is None:
+            self._gas_client = GASClient(self.http_session)
+        return self._gas_client
     
     async def on_ready(self):
         """Bot準備完了時"""
@@ -35,7 +149,7 @@ class MyBot(commands.Bot):
         print(f'Bot is in {len(self.guilds)} guilds')
         print("Bot is ready and commands should be available!")
     
-    @tasks.loop(time=time(hour=0, minute=10, tzinfo=timezone(timedelta(hours=9))))
+    @tasks.loop(time=NOTIFICATION_TIME)
     async def daily_formula_notification(self):
         """毎日0時（日本時間）の数式通知タスク"""
         try:
@@ -50,73 +164,274 @@ class MyBot(commands.Bot):
                 print(f"通知チャンネル (ID: {notification_channel_id}) が見つかりません。")
                 return
             
-            # Firebaseから今日の数式を取得
-            firebase_client = FirebaseClient()
-            today_formulas = firebase_client.get_today_formulas()
+            # 未通知の数式を送信
+            count = await self.run_formula_notification(channel)
+            self.notification_state.mark_run(datetime.now(JST).strftime('%Y-%m-%d'))
             
-            if not today_formulas:
-                # 今日登録された数式がない場合
-                embed = discord.Embed(
-                    title="今日の数式登録",
-                    description="今日はまだ新しい数式が登録されていません。",
-                    color=0x888888
-                )
-                embed.set_footer(text="Graph + Library = Graphary")
-                await channel.send(embed=embed)
-                return
+            print(f"今日の数式通知を送信しました: {count}件")
             
-            # 数式が登録されている場合 - 各数式を個別のEmbedで送信
-            for i, formula_data in enumerate(today_formulas):
-                formatted_data = firebase_client.format_formula_for_discord(formula_data)
-                
-                # 個別のEmbedを作成
-                embed = discord.Embed(
-                    title=formatted_data['title'],
-                    description=f"```\n{formatted_data['formula']}\n```",
-                    color=0x00FF7F,
-                    url=f"https://teth-main.github.io/Graphary/?formulaId={formatted_data['id']}"
-                )
-                
-                # 数式タイプを追加
-                if formatted_data['formula_type']:
-                    type_list = "\n".join([f"`{t}`" for t in formatted_data['formula_type'].split(', ')])
-                    embed.add_field(
-                        name="数式タイプ",
-                        value=type_list,
-                        inline=True
-                    )
-                
-                # タグを追加
-                if formatted_data['tags'] and formatted_data['tags'] != 'なし':
-                    tag_list = "\n".join([f"`{t}`" for t in formatted_data['tags'].split(', ')])
-                    embed.add_field(
-                        name="タグ",
-                        value=tag_list,
-                        inline=True
-                    )
-                
-                # 画像を設定（必ずあるので大きく表示）
-                if formatted_data['image_url']:
-                    embed.set_image(url=formatted_data['image_url'])
-                
-                embed.set_footer(text="Graph + Library = Graphary")
-                
-                await channel.send(embed=embed)
-                
-                # 連続送信の間隔を少し空ける
-                if i < len(today_formulas) - 1:
-                    import asyncio
-                    await asyncio.sleep(1)
+        except Exception as e:
+            print(f"数式通知エラー: {e}")
+    
+    async def run_formula_notification(self, channel, priority=PRIORITY_BULK):
+        """
+        まだ通知していない数式をチャンネルに送信し、ウォーターマークを進める
+        
+        通知済みの記録とウォーターマークの更新は、送信先が通知チャンネルの場合だけ行う
+        （他のチャンネルでの手動実行で定期通知の分を消費しないため）。
+        
+        Args:
+            channel: 送信先チャンネル
+            priority (int): 送信キューでの優先度
             
-            print(f"今日の数式通知を送信しました: {len(today_formulas)}件")
+        Returns:
+            int: 通知した数式の数
+        """
+        state = self.notification_state
+        notification_channel_id = os.getenv('FORMULA_NOTIFICATION_CHANNEL_ID')
+        persist = bool(notification_channel_id) and str(channel.id) == notification_channel_id.strip()
+        
+        # ウォーターマーク以降の数式だけをページ単位で取得（初回は前日0時以降）
+        # 同じ登録時刻の通知済みの数式は通知済みIDで除く
+        start = state.last_timestamp or get_today_start_utc()
+        lookback = state.lookback_start()
+        
+        async def unannounced_pages():
+            async for page in self.firebase_client.iter_formulas_since(start):
+                page = [f for f in page if not state.is_announced(f['id'])]
+                if page:
+                    yield page
             
+            # ウォーターマークより前の登録時刻で後から書き込まれた数式（IDだけで確認し、未通知の分だけ読む）
+            if lookback is not None:
+                late = await self.firebase_client.get_formulas_between(lookback, start, exclude=state.is_announced)
+                if late:
+                    yield late
+        
+        # 各数式のEmbedをまとめて送信（送信できた分から通知済みにする）
+        count = await self.send_formula_embeds(channel, unannounced_pages(), priority=priority, on_batch_sent=state.mark_announced if persist else None)
+        
+        if not count:
+            # 新しく登録された数式がない場合
+            embed = discord.Embed(
+                title="今日の数式登録",
+                description="今日はまだ新しい数式が登録されていません。",
+                color=0x888888
+            )
+            embed.set_footer(text="Graph + Library = Graphary")
+            await self.sender.send(channel, embed=embed, priority=priority)
+            return 0
+        
+        # 全て送信できたらウォーターマークを進める
+        if persist:
+            state.advance_watermark()
+        return count
+    
+    async def send_formula_embeds(self, channel, pages, priority=PRIORITY_BULK, on_batch_sent=None):
+        """
+        数式ごとのEmbedを1メッセージ最大10件・合計6000文字以内にまとめて送信
+        
+        ページを送信している間に次のページを先読みし、各ページの端数は次のページと合わせて詰める。
+        送信間隔は送信キューのトークンバケットと、discord.pyのレート制限ヘッダー処理で調整する。
+        
+        Args:
+            channel: 送信先チャンネル
+            pages: 数式データのリストを順に返す非同期イテレータ
+            priority (int): 送信キューでの優先度
+            on_batch_sent: 1メッセージ送信するごとに、そのメッセージに含めた数式のリストで呼ばれる
+            
+        Returns:
+            int: 送信した数式の数
+        """
+        sent = 0
+        # 未送信の (数式データ, Embed)
+        pending = []
+        
+        async def send_batch(entries):
+            await self.sender.send(channel, embeds=[embed for _, embed in entries], priority=priority)
+            if on_batch_sent:
+                on_batch_sent([formula_data for formula_data, _ in entries])
+        
+        # 次のページの取得は、現在のページを送信している間に先に始めておく
+        pages = aiter(pages)
+        next_page = asyncio.ensure_future(anext(pages))
+        try:
+            while True:
+                try:
+                    page = await next_page
+                except StopAsyncIteration:
+                    break
+                next_page = asyncio.ensure_future(anext(pages))
+                
+                for formula_data in page:
+                    formatted_data = await self.firebase_client.format_formula_for_discord(formula_data)
+                    pending.append((formula_data, create_formula_embed(formatted_data)))
+                
+                # 最後のまとまりは次のページと合わせて詰めるため残しておく
+                batches = pack_embeds([embed for _, embed in pending])
+                for batch in batches[:-1]:
+                    await send_batch(pending[:len(batch)])
+                    sent += len(batch)
+                    pending = pending[len(batch):]
+        finally:
+            if not next_page.done():
+                next_page.cancel()
+        
+        if pending:
+            await send_batch(pending)
+            sent += len(pending)
+        return sent
+    
+    def _on_formula_changed(self, doc_id, data):
+        """ミラーの変更通知（リスナースレッドから呼ばれる）"""
+        self.loop.call_soon_threadsafe(self.random_embed_pool.discard, doc_id)
+    
+    async def build_random_formula_embed(self):
+        """
+        ランダムな数式のEmbedを作成
+        
+        Returns:
+            tuple: (数式ID, Embed)、数式が取得できなければNone
+        """
+        random_formula = await self.firebase_client.get_random_formula()
+        if not random_formula:
+            return None
+        formatted_data = await self.firebase_client.format_formula_for_discord(random_formula)
+        return random_formula['id'], create_formula_embed(formatted_data)
+    
+    @tasks.loop(seconds=5)
+    async def refill_random_embed_pool(self):
+        """ランダム表示用Embedプールがlow_waterを下回ったら補充"""
+        if not self.random_embed_pool.needs_refill():
+            return
+        try:
+            await self.random_embed_pool.refill(self.build_random_formula_embed)
         except Exception as e:
-            print(f"数式通知エラー: {e}")
+            print(f"Embedプール補充エラー: {e}")
+    
+    @refill_random_embed_pool.before_loop
+    async def before_refill_random_embed_pool(self):
+        """補充タスク開始前の待機"""
+        await self.wait_until_ready()
+    
+    @tasks.loop(seconds=MESSAGE_CACHE_RECONCILE_INTERVAL)
+    async def reconcile_message_templates(self):
+        """メッセージテンプレートの未送信の変更をシートへ送り、シート側の変更を取り込む"""
+        try:
+            await self.message_cache.sync()
+        except Exception as e:
+            print(f"メッセージテンプレート同期エラー: {e}")
+    
+    def kick_registration_outbox(self):
+        """登録申請アウトボックスの送信を今すぐ開始（送信間隔を待たない）"""
+        task = asyncio.create_task(self.drain_outbox_once())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    @tasks.loop(seconds=OUTBOX_DRAIN_INTERVAL)
+    async def drain_registration_outbox(self):
+        """送信時刻を過ぎた登録申請をGASへ送信"""
+        await self.drain_outbox_once()
+    
+    @drain_registration_outbox.before_loop
+    async def before_drain_registration_outbox(self):
+        """送信タスク開始前の待機"""
+        await self.wait_until_ready()
+    
+    async def drain_outbox_once(self):
+        """登録申請アウトボックスを1回分送信（同時には1つだけ実行）"""
+        async with self._outbox_lock:
+            try:
+                await self._drain_outbox_batch()
+            except Exception as e:
+                # SQLiteのロック待ちなどで失敗しても送信タスクは止めず、次回に再試行する
+                print(f"登録申請アウトボックスエラー: {e}")
+    
+    async def _drain_outbox_batch(self):
+        """送信時刻を過ぎた登録申請を1バッチ分送信して結果を記録"""
+        gas_client = self.gas_client
+        entries = await asyncio.to_thread(self.registration_outbox.due, OUTBOX_BATCH_SIZE)
+        
+        if entries:
+            # 送信待ちの申請をまとめて1回のリクエストで登録する
+            result = await gas_client.register_formulas(
+                [entry.payload for entry in entries],
+                request_ids=[entry.idempotency_key for entry in entries]
+            )
+            results = result.get('result') if result.get('success') else None
+            if isinstance(results, list) and len(results) == len(entries):
+                # 1件ごとの結果を反映（失敗した申請だけ再試行する）
+                for entry, item in zip(entries, results):
+                    if isinstance(item, dict) and item.get('success'):
+                        await self._on_registration_sent(entry, item.get('result'))
+                    else:
+                        error_msg = item.get('error', '不明なエラー') if isinstance(item, dict) else f"予期しない応答: {item}"
+                        await self._on_registration_error(entry, error_msg)
+            elif not result.get('success') and 'Unknown request type' in str(result.get('error', '')):
+                # formulas_batch を知らない古いmain.gsの場合だけ1件ずつ送り直す
+                print("GASがまとめて登録に対応していないため1件ずつ送信します")
+                for entry in entries:
+                    single = await gas_client.register_formula(entry.payload, request_id=entry.idempotency_key)
+                    if single.get('success'):
+                        await self._on_registration_sent(entry, single.get('result'))
+                    else:
+                        await self._on_registration_error(entry, single.get('error', '不明なエラー'))
+            else:
+                # タイムアウトなどではGAS側でまだ処理中の可能性があるため、すぐには送り直さず再試行に回す
+                # （再送時は申請キーでGAS側の二重登録を防ぐ）
+                error_msg = result.get('error', '不明なエラー') if not result.get('success') else f"予期しない応答: {results}"
+                for entry in entries:
+                    await self._on_registration_error(entry, error_msg)
+        
+        await asyncio.to_thread(self.registration_outbox.purge_sent)
+    
+    async def _on_registration_sent(self, entry, result):
+        """GASへの送信が完了した登録申請を記録"""
+        await asyncio.to_thread(self.registration_outbox.mark_sent, entry.id, result)
+        print(f"登録申請 #{entry.id} を送信しました: {result}")
+        
+        # 新しいタグが作成された場合はタグキャッシュを破棄して取り直す
+        tag_ids = (result or {}).get('tagIds', '')
+        if entry.payload.get('newTags') or not self.tag_cache.contains(tag_ids):
+            self.tag_cache.invalidate()
+    
+    async def _on_registration_error(self, entry, error_msg):
+        """GASへの送信に失敗した登録申請を再試行に回す（上限に達したら申請者に知らせる）"""
+        print(f"登録申請 #{entry.id} の送信エラー: {error_msg}")
+        if not await asyncio.to_thread(self.registration_outbox.mark_retry, entry.id, error_msg):
+            await self.notify_registration_failed(entry, error_msg)
+    
+    async def notify_registration_failed(self, entry, error_msg):
+        """再試行を諦めた登録申請を申請者にDMで知らせる"""
+        if not entry.user_id:
+            return
+        try:
+            user = self.get_user(entry.user_id) or await self.fetch_user(entry.user_id)
+            embed = discord.Embed(
+                title="登録失敗 / Registration Failed",
+                description=(
+                    f"❌ 登録申請 #{entry.id}「{entry.payload.get('title', '')}」を登録できませんでした。\n"
+                    f"Failed to register your formula request #{entry.id}.\n\n"
+                    f"エラー/Error: {error_msg}"
+                ),
+                color=0xFF0000
+            )
+            await self.sender.send(user, embed=embed)
+        except Exception as e:
+            print(f"登録失敗の通知エラー: {e}")
     
     @daily_formula_notification.before_loop
     async def before_daily_notification(self):
-        """通知タスク開始前の待機"""
+        """通知タスク開始前の待機（停止中に通知時刻を過ぎていたら追いかけて送信）"""
         await self.wait_until_ready()
+        
+        now_jst = datetime.now(JST)
+        today = now_jst.strftime('%Y-%m-%d')
+        scheduled = datetime.combine(now_jst.date(), NOTIFICATION_TIME)
+        last_run_date = self.notification_state.last_run_date
+        if last_run_date and last_run_date < today and now_jst >= scheduled:
+            print(f"{today} の定期通知が未実行のため送信します。")
+            await self.daily_formula_notification()
     
     async def on_member_join(self, member):
         """新しいメンバーがサーバーに参加した時"""
@@ -172,7 +487,7 @@ class MyBot(commands.Bot):
             embed.timestamp = discord.utils.utcnow()
             
             # メッセージを送信
-            await channel.send(f"{member.mention}", embed=embed)
+            await self.sender.send(channel, f"{member.mention}", embed=embed)
             
             print(f"Welcome message sent for {member.name} ({member.id})")
             
@@ -232,9 +547,11 @@ async def admin_message_command(
         return
     
     try:
+        await interaction.response.defer(ephemeral=True)
+        
         # メッセージキーが指定されている場合は、登録されたメッセージを使用
         if message_key:
-            message_data = get_message(message_key)
+            message_data = await bot.message_cache.get(message_key)
             if message_data:
                 content = message_data["content"]
                 if "embed" in message_data:
@@ -243,11 +560,11 @@ async def admin_message_command(
                     embed_description = embed_data.get("description")
                     embed_color = embed_data.get("color")
             else:
-                await interaction.response.send_message(f"メッセージキー '{message_key}' が見つかりません。", ephemeral=True)
+                await bot.sender.followup(interaction, f"メッセージキー '{message_key}' が見つかりません。", ephemeral=True)
                 return
         
         if not content:
-            await interaction.response.send_message("メッセージの内容またはメッセージキーを指定してください。", ephemeral=True)
+            await bot.sender.followup(interaction, "メッセージの内容またはメッセージキーを指定してください。", ephemeral=True)
             return
         
         # 送信先チャンネルの決定
@@ -276,20 +593,20 @@ async def admin_message_command(
             embed.set_footer(text=f"管理者コマンド | 実行者: {interaction.user.display_name}")
             
             # メッセージとEmbedを送信
-            await target_channel.send(content)
-            await target_channel.send(embed=embed)
+            await bot.sender.send(target_channel, content, priority=PRIORITY_INTERACTIVE)
+            await bot.sender.send(target_channel, embed=embed, priority=PRIORITY_INTERACTIVE)
         else:
             # 通常のメッセージのみ送信
-            await target_channel.send(content)
+            await bot.sender.send(target_channel, content, priority=PRIORITY_INTERACTIVE)
         
         # 実行確認メッセージ
         if target_channel != interaction.channel:
-            await interaction.response.send_message(f"メッセージを {target_channel.mention} に送信しました。", ephemeral=True)
+            await bot.sender.followup(interaction, f"メッセージを {target_channel.mention} に送信しました。", ephemeral=True)
         else:
-            await interaction.response.send_message("メッセージを送信しました。", ephemeral=True)
+            await bot.sender.followup(interaction, "メッセージを送信しました。", ephemeral=True)
             
     except Exception as e:
-        await interaction.response.send_message(f"エラーが発生しました: {str(e)}", ephemeral=True)
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 @bot.tree.command(name="ping", description="Botの応答時間を確認します")
 async def ping_command(interaction: discord.Interaction):
@@ -300,14 +617,19 @@ async def ping_command(interaction: discord.Interaction):
 @bot.tree.command(name="random_graphary", description="Grapharyからランダムに数式を1つ表示します / Display a random formula from Graphary")
 async def random_graphary_command(interaction: discord.Interaction):
     """誰でも使える：ランダムな数式を表示"""
+    # 事前生成済みのEmbedがあればdeferせずに即答する
+    embed = bot.random_embed_pool.take()
+    if embed:
+        await interaction.response.send_message(embed=embed)
+        return
+    
     try:
         await interaction.response.defer()
         
-        # Firebaseからランダムな数式を取得
-        firebase_client = FirebaseClient()
-        random_formula = firebase_client.get_random_formula()
+        # Firebaseからランダムな数式を取得してEmbedを作成（通知と同じスタイル）
+        entry = await bot.build_random_formula_embed()
         
-        if not random_formula:
+        if not entry:
             # 数式が見つからない場合
             embed = discord.Embed(
                 title="数式が見つかりません",
@@ -315,55 +637,138 @@ async def random_graphary_command(interaction: discord.Interaction):
                 color=0x888888
             )
             embed.set_footer(text="Graph + Library = Graphary")
-            await interaction.followup.send(embed=embed)
+            await bot.sender.followup(interaction, embed=embed)
             return
         
-        # 数式データをフォーマット
-        formatted_data = firebase_client.format_formula_for_discord(random_formula)
+        _, embed = entry
+        await bot.sender.followup(interaction, embed=embed)
         
-        # Embedを作成（通知と同じスタイル）
-        embed = discord.Embed(
-            title=formatted_data['title'],
-            description=f"```\n{formatted_data['formula']}\n```",
-            color=0x00FF7F,
-            url=f"https://teth-main.github.io/Graphary/?formulaId={formatted_data['id']}"
-        )
+    except Exception as e:
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
+
+@bot.tree.command(name="search_graphary", description="Grapharyの数式をキーワードで検索します / Search formulas in Graphary")
+@app_commands.describe(
+    query="検索キーワード（タイトル・英語タイトル・タグ・数式タイプ） / Keywords",
+    tag="タグで絞り込み / Filter by tag"
+)
+async def search_graphary_command(interaction: discord.Interaction, query: str = None, tag: str = None):
+    """誰でも使える：数式をキーワード・タグで検索"""
+    if not query and not tag:
+        await interaction.response.send_message("キーワードかタグを指定してください。\nPlease specify keywords or a tag.", ephemeral=True)
+        return
+    
+    try:
+        await interaction.response.defer()
         
-        # 数式タイプを追加
-        if formatted_data['formula_type']:
-            type_list = "\n".join([f"`{t}`" for t in formatted_data['formula_type'].split(', ')])
-            embed.add_field(
-                name="数式タイプ",
-                value=type_list,
-                inline=True
-            )
+        # 検索インデックスから一致する数式IDを取得
+        firebase_client = bot.firebase_client
+        formula_ids = await firebase_client.search_formulas(query or '', tag_id=tag)
         
-        # タグを追加
-        if formatted_data['tags'] and formatted_data['tags'] != 'なし':
-            tag_list = "\n".join([f"`{t}`" for t in formatted_data['tags'].split(', ')])
-            embed.add_field(
-                name="タグ",
-                value=tag_list,
-                inline=True
+        # 表示用の検索条件
+        label = query or ''
+        if tag:
+            tag_info = await firebase_client.get_tag_name(tag)
+            label = f"{label} #{tag_info.get('tagName', tag)}".strip()
+        
+        if not formula_ids:
+            embed = discord.Embed(
+                title="数式が見つかりません / No formulas found",
+                description=f"「{label}」に一致する数式はありませんでした。",
+                color=0x888888
             )
+            embed.set_footer(text="Graph + Library = Graphary")
+            await bot.sender.followup(interaction, embed=embed)
+            return
         
-        # 画像を設定（大きく表示）
-        if formatted_data['image_url']:
-            embed.set_image(url=formatted_data['image_url'])
+        view = FormulaSearchView(interaction.user.id, label, formula_ids)
+        embed = await view.render_page()
+        await bot.sender.followup(interaction, embed=embed, view=view)
         
-        embed.set_footer(text="Graph + Library = Graphary")
+    except Exception as e:
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
+
+@search_graphary_command.autocomplete('tag')
+async def search_graphary_tag_autocomplete(interaction: discord.Interaction, current: str):
+    """タグ名の入力途中でタグ候補を返す"""
+    try:
+        tag_index = await bot.firebase_client.get_tag_index()
+        choices = []
+        for tag in tag_index.search(current):
+            name = str(tag.get('tagName') or tag['tagID'])
+            if tag.get('tagName_EN') and tag['tagName_EN'] != name:
+                name = f"{name} / {tag['tagName_EN']}"
+            choices.append(app_commands.Choice(name=name[:100], value=str(tag['tagID'])))
+        return choices
+    except Exception as e:
+        print(f"タグ候補取得エラー: {e}")
+        return []
+
+class FormulaSearchView(discord.ui.View):
+    """検索結果のページ送りビュー（1ページ1数式）"""
+    
+    def __init__(self, user_id, query, formula_ids):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.query = query
+        self.formula_ids = formula_ids
+        self.page = 0
+        self._update_buttons()
+    
+    def _update_buttons(self):
+        """ページ位置に応じてボタンの有効・無効を切り替え"""
+        self.prev_button.disabled = self.page <= 0
+        self.next_button.disabled = self.page >= len(self.formula_ids) - 1
+    
+    async def render_page(self):
+        """現在のページのEmbedを作成"""
+        firebase_client = bot.firebase_client
+        formula_data = await firebase_client.get_formula(self.formula_ids[self.page])
         
-        await interaction.followup.send(embed=embed)
+        if not formula_data:
+            embed = discord.Embed(
+                title="数式が見つかりません / Formula not found",
+                description="この数式は削除された可能性があります。",
+                color=0x888888
+            )
+        else:
+            formatted_data = await firebase_client.format_formula_for_discord(formula_data)
+            embed = create_formula_embed(formatted_data)
         
-    except Exception as e:
-        await interaction.followup.send(f"エラーが発生しました: {str(e)}", ephemeral=True)
+        embed.set_footer(text=f"Graph + Library = Graphary | 「{self.query}」 {self.page + 1}/{len(self.formula_ids)}")
+        return embed
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """検索した本人だけがページを送れる"""
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("この検索結果は操作できません。/search_graphary で検索してください。", ephemeral=True)
+            return False
+        return True
+    
+    @discord.ui.button(label="◀ 前へ / Prev", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        """前のページ"""
+        self.page = max(self.page - 1, 0)
+        self._update_buttons()
+        embed = await self.render_page()
+        await interaction.response.edit_message(embed=embed, view=self)
+    
+    @discord.ui.button(label="次へ / Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        """次のページ"""
+        self.page = min(self.page + 1, len(self.formula_ids) - 1)
+        self._update_buttons()
+        embed = await self.render_page()
+        await interaction.response.edit_message(embed=embed, view=self)
 
 @bot.tree.command(name="register_graphary", description="Grapharyに新しい数式を登録します / Register a new formula to Graphary")
 async def register_graphary_command(interaction: discord.Interaction):
     """誰でも使える：数式登録コマンド"""
     try:
+        # モーダル入力中にタグリストの取得を先に始めておく
+        tags_task = asyncio.create_task(bot.tag_cache.get())
+        
         # 数式登録モーダルを表示
-        modal = FormulaRegistrationModal()
+        modal = FormulaRegistrationModal(tags_task)
         await interaction.response.send_modal(modal)
         
     except Exception as e:
@@ -372,7 +777,7 @@ async def register_graphary_command(interaction: discord.Interaction):
 class FormulaRegistrationModal(discord.ui.Modal):
     """数式登録モーダル"""
     
-    def __init__(self):
+    def __init__(self, tags_task):
         super().__init__(
             title="数式登録 / Formula Registration",
             # 注意書きをdescriptionとして追加
@@ -381,6 +786,8 @@ class FormulaRegistrationModal(discord.ui.Modal):
                 "(Please complete the registration within 15 minutes. After that, the process will expire and cannot be completed.)"
             )
         )
+        # 先読み中のタグリスト（タグ選択時に使う）
+        self.tags_task = tags_task
 
         # タイトル（必須）
         self.title_input = discord.ui.TextInput(
@@ -433,33 +840,34 @@ class FormulaRegistrationModal(discord.ui.Modal):
             }
             
             # 数式タイプ選択メニューを表示
-            view = FormulaTypeSelectView(self.form_data)
+            view = FormulaTypeSelectView(self.form_data, self.tags_task)
             embed = discord.Embed(
                 title="数式タイプ選択 / Formula Type Selection",
                 description="数式のタイプを選択してください（複数選択可能）：\nSelect formula types (multiple selection allowed):",
                 color=0x00FF7F
             )
-            await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+            await bot.sender.followup(interaction, embed=embed, view=view, ephemeral=True)
             
         except Exception as e:
-            await interaction.followup.send(f"エラーが発生しました: {str(e)}", ephemeral=True)
+            await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 class FormulaTypeSelectView(discord.ui.View):
     """数式タイプ選択ビュー"""
     
-    def __init__(self, form_data):
+    def __init__(self, form_data, tags_task):
         super().__init__(timeout=300)
         self.form_data = form_data
         
         # 数式タイプ選択メニュー
-        self.type_select = FormulaTypeSelect(form_data)
+        self.type_select = FormulaTypeSelect(form_data, tags_task)
         self.add_item(self.type_select)
 
 class FormulaTypeSelect(discord.ui.Select):
     """数式タイプ選択メニュー"""
     
-    def __init__(self, form_data):
+    def __init__(self, form_data, tags_task):
         self.form_data = form_data
+        self.tags_task = tags_task
         
         # 選択肢を定義
         options = [
@@ -485,40 +893,99 @@ class FormulaTypeSelect(discord.ui.Select):
             # 選択された数式タイプを保存
             self.form_data['formula_type'] = ', '.join(self.values)
 
-            # まず「タグ情報を取得中...」のメッセージを送信
-            loading_message = await interaction.followup.send(
-                content="タグ情報を取得中です...しばらくお待ちください。\n(Loading tags from database...)",
-                ephemeral=True
-            )
+            # 先読みが終わっていなければ「タグ情報を取得中...」のメッセージを送信
+            loading_message = None
+            if not self.tags_task.done():
+                loading_message = await bot.sender.followup(interaction, 
+                    content="タグ情報を取得中です...しばらくお待ちください。\n(Loading tags from database...)",
+                    ephemeral=True
+                )
 
-            # タグ選択フェーズに進む
-            gas_client = GASClient()
-            tags_data = await gas_client.get_tags_list()
+            # タグ選択フェーズに進む（コマンド実行時に始めた先読みの結果を使う）
+            gas_client = bot.gas_client
+            tags_data = await self.tags_task
+            if not tags_data:
+                # 先読みが失敗していた場合は取り直す
+                tags_data = await bot.tag_cache.get()
 
             if not tags_data:
-                await interaction.followup.send("タグデータの取得に失敗しました。", ephemeral=True)
+                await bot.sender.followup(interaction, "タグデータの取得に失敗しました。", ephemeral=True)
                 return
 
-            # タグリストを表示
-            tags_display = gas_client.format_tags_for_display(tags_data)
+            # タグリストを表示（タグが多い場合はフィールド・Embed・メッセージの上限に合わせて分割）
+            tags_pages = gas_client.format_tags_pages(tags_data)
 
-            embed = discord.Embed(
-                title="タグ選択 / Tag Selection",
-                description=f"利用可能なタグ一覧：\nAvailable tags:\n{tags_display}\n\n**使用方法 / Usage:**\n• 番号をカンマ区切りで入力 / Enter numbers separated by commas: 例/e.g. `1, 3, 10`\n• タグなしの場合は「なし」と入力 / Enter \"なし\" for no tags",
-                color=0x00FF7F
-            )
+            title = "タグ選択 / Tag Selection"
+            description = "**使用方法 / Usage:**\n• 番号をカンマ区切りで入力 / Enter numbers separated by commas: 例/e.g. `1, 3, 10`\n• 範囲指定やタグ名も可 / Ranges and tag names also work: 例/e.g. `1-5, 9, フラクタル`\n• タグなしの場合は「なし」と入力 / Enter \"なし\" for no tags\n• 🔎 ボタンでタグ名から検索して選択 / Use 🔎 to search tags by name"
+            fields = [
+                (f"利用可能なタグ一覧 / Available tags ({i}/{len(tags_pages)})" if len(tags_pages) > 1 else "利用可能なタグ一覧 / Available tags", page)
+                for i, page in enumerate(tags_pages, 1)
+            ]
+            embeds = []
+            for group in pack_fields(fields, reserved=len(title) + len(description)):
+                embed = discord.Embed(title=title, color=0x00FF7F) if not embeds else discord.Embed(color=0x00FF7F)
+                for name, value in group:
+                    embed.add_field(name=name, value=value, inline=False)
+                embeds.append(embed)
+            embeds[0].description = description
 
+            # 入力ボタンは最後のメッセージに付ける
             view = TagInputView(self.form_data, tags_data)
-            await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+            batches = pack_embeds(embeds)
+            for batch in batches[:-1]:
+                await bot.sender.followup(interaction, embeds=batch, ephemeral=True)
+            await bot.sender.followup(interaction, embeds=batches[-1], view=view, ephemeral=True)
 
             # ローディングメッセージを削除（エフェメラルなので消さなくてもOKだが、UX向上のため）
-            try:
-                await loading_message.delete()
-            except Exception:
-                pass
+            if loading_message is not None:
+                try:
+                    await loading_message.delete()
+                except Exception:
+                    pass
 
         except Exception as e:
-            await interaction.followup.send(f"エラーが発生しました: {str(e)}", ephemeral=True)
+            await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
+
+def build_registration_confirmation_embed(form_data, selected_tag_names):
+    """
+    数式登録の最終確認Embedを作成
+    
+    Args:
+        form_data (dict): 入力された登録内容
+        selected_tag_names (list): 選択されたタグ名のリスト
+        
+    Returns:
+        discord.Embed: 確認用のEmbed
+    """
+    embed = discord.Embed(
+        title="数式登録確認 / Formula Registration Confirmation",
+        color=0x00FF7F
+    )
+    
+    embed.add_field(name="タイトル / Title", value=form_data['title'][:250] + ("..." if len(form_data['title']) > 250 else ""), inline=False)
+    
+    if form_data['title_EN']:
+        title_en_display = form_data['title_EN'][:250] + ("..." if len(form_data['title_EN']) > 250 else "")
+        embed.add_field(name="英語タイトル / English Title", value=title_en_display, inline=False)
+    else:
+        embed.add_field(name="英語タイトル / English Title", value="なし / None", inline=False)
+    
+    # 数式を短縮表示
+    formula_display = form_data['formula']
+    if len(formula_display) > 100:
+        formula_display = formula_display[:100] + "..."
+    embed.add_field(name="数式 / Formula", value=f"```\n{formula_display}\n```", inline=False)
+    
+    embed.add_field(name="タイプ / Type", value=form_data['formula_type'], inline=False)
+    
+    tags_display = ', '.join(selected_tag_names) if selected_tag_names else 'なし / None'
+    embed.add_field(name="タグ / Tags", value=tags_display, inline=False)
+    
+    # 画像をプレビュー表示
+    if form_data['image_url']:
+        embed.set_image(url=form_data['image_url'])
+    
+    return embed
 
 class TagInputView(discord.ui.View):
     """タグ入力ビュー"""
@@ -531,6 +998,10 @@ class TagInputView(discord.ui.View):
         # タグ入力モーダルボタン
         self.tag_button = TagInputButton(form_data, tags_data)
         self.add_item(self.tag_button)
+        
+        # タグ検索ボタン（キーワードで探して選択）
+        self.search_button = TagSearchButton(form_data, tags_data)
+        self.add_item(self.search_button)
 
 class TagInputButton(discord.ui.Button):
     """タグ入力ボタン"""
@@ -545,6 +1016,119 @@ class TagInputButton(discord.ui.Button):
         modal = TagInputModal(self.form_data, self.tags_data)
         await interaction.response.send_modal(modal)
 
+class TagSearchButton(discord.ui.Button):
+    """タグ検索ボタン"""
+    
+    def __init__(self, form_data, tags_data):
+        super().__init__(label="タグを検索 / Search Tags", style=discord.ButtonStyle.secondary, emoji="🔎")
+        self.form_data = form_data
+        self.tags_data = tags_data
+    
+    async def callback(self, interaction: discord.Interaction):
+        """タグ検索ボタンクリック時の処理"""
+        modal = TagSearchModal(self.form_data, self.tags_data)
+        await interaction.response.send_modal(modal)
+
+class TagSearchModal(discord.ui.Modal):
+    """タグ検索モーダル"""
+    
+    def __init__(self, form_data, tags_data):
+        super().__init__(title="タグ検索 / Tag Search")
+        self.form_data = form_data
+        self.tags_data = tags_data
+        
+        # 検索キーワード入力フィールド
+        self.keyword_input = discord.ui.TextInput(
+            label="キーワード / Keywords",
+            placeholder="例/e.g.: 関数, fractal（カンマ区切りで複数可 / comma separated）",
+            required=True,
+            max_length=200
+        )
+        self.add_item(self.keyword_input)
+    
+    async def on_submit(self, interaction: discord.Interaction):
+        """タグ検索送信時の処理"""
+        try:
+            await interaction.response.defer(ephemeral=True)
+            
+            # キーワードごとにタグ名インデックスを引いて、重複を除いてまとめる
+            keywords = [k.strip() for k in self.keyword_input.value.split(',') if k.strip()]
+            per_keyword = max(MAX_TAG_CHOICES // max(len(keywords), 1), 1)
+            catalog = TagCatalog.of(self.tags_data)
+            index = catalog.index
+            results = []
+            seen = set()
+            for keyword in keywords:
+                for tag in index.search(keyword, per_keyword):
+                    tag_id = str(tag.get('tagID', ''))
+                    if tag_id and tag_id not in seen:
+                        seen.add(tag_id)
+                        results.append(tag)
+            
+            if not results:
+                await bot.sender.followup(interaction, "一致するタグが見つかりませんでした。\nNo matching tags found.", ephemeral=True)
+                return
+            
+            view = TagSearchResultView(self.form_data, catalog, results[:MAX_TAG_CHOICES])
+            await bot.sender.followup(interaction, 
+                "検索結果からタグを選択してください（複数選択可）：\nSelect tags from the results (multiple selection allowed):",
+                view=view,
+                ephemeral=True
+            )
+            
+        except Exception as e:
+            await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
+
+class TagSearchResultView(discord.ui.View):
+    """タグ検索結果ビュー"""
+    
+    def __init__(self, form_data, catalog, tags):
+        super().__init__(timeout=300)
+        self.form_data = form_data
+        
+        # 検索結果のタグ選択メニュー
+        self.tag_select = TagSearchSelect(form_data, catalog, tags)
+        self.add_item(self.tag_select)
+
+class TagSearchSelect(discord.ui.Select):
+    """タグ検索結果の選択メニュー"""
+    
+    def __init__(self, form_data, catalog, tags):
+        self.form_data = form_data
+        self.catalog = catalog
+        
+        options = [
+            discord.SelectOption(
+                label=str(tag.get('tagName') or tag.get('tagID'))[:100],
+                value=str(tag.get('tagID', '')),
+                description=str(tag.get('tagName_EN'))[:100] if tag.get('tagName_EN') else None
+            )
+            for tag in tags
+        ]
+        
+        super().__init__(
+            placeholder="タグを選択 / Select tags",
+            min_values=1,
+            max_values=len(options),
+            options=options
+        )
+    
+    async def callback(self, interaction: discord.Interaction):
+        """タグ選択時の処理"""
+        try:
+            await interaction.response.defer(ephemeral=True)
+            
+            self.form_data['tags'] = ','.join(self.values)
+            selected_tag_names = self.catalog.names(self.values)
+            
+            # 最終確認を表示
+            embed = build_registration_confirmation_embed(self.form_data, selected_tag_names)
+            view = ConfirmationView(self.form_data)
+            await bot.sender.followup(interaction, embed=embed, view=view, ephemeral=True)
+            
+        except Exception as e:
+            await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
+
 class TagInputModal(discord.ui.Modal):
     """タグ入力モーダル"""
     
@@ -556,7 +1140,7 @@ class TagInputModal(discord.ui.Modal):
         # タグ入力フィールド
         self.tag_input = discord.ui.TextInput(
             label="タグ選択 / Tag Selection",
-            placeholder="例/e.g.: 1, 3, 10 または/or なし",
+            placeholder="例/e.g.: 1, 3, 10 / 1-5, 9 または/or なし",
             required=True,
             max_length=200
         )
@@ -568,46 +1152,19 @@ class TagInputModal(discord.ui.Modal):
             await interaction.response.defer(ephemeral=True)
             
             # タグ選択を解析
-            gas_client = GASClient()
+            gas_client = bot.gas_client
             tag_ids_str = gas_client.parse_tag_selection(self.tags_data, self.tag_input.value)
             selected_tag_names = gas_client.get_selected_tag_names(self.tags_data, tag_ids_str)
             
             self.form_data['tags'] = tag_ids_str
             
             # 最終確認を表示
-            embed = discord.Embed(
-                title="数式登録確認 / Formula Registration Confirmation",
-                color=0x00FF7F
-            )
-            
-            embed.add_field(name="タイトル / Title", value=self.form_data['title'][:250] + ("..." if len(self.form_data['title']) > 250 else ""), inline=False)
-            
-            if self.form_data['title_EN']:
-                title_en_display = self.form_data['title_EN'][:250] + ("..." if len(self.form_data['title_EN']) > 250 else "")
-                embed.add_field(name="英語タイトル / English Title", value=title_en_display, inline=False)
-            else:
-                embed.add_field(name="英語タイトル / English Title", value="なし / None", inline=False)
-            
-            # 数式を短縮表示
-            formula_display = self.form_data['formula']
-            if len(formula_display) > 100:
-                formula_display = formula_display[:100] + "..."
-            embed.add_field(name="数式 / Formula", value=f"```\n{formula_display}\n```", inline=False)
-            
-            embed.add_field(name="タイプ / Type", value=self.form_data['formula_type'], inline=False)
-            
-            tags_display = ', '.join(selected_tag_names) if selected_tag_names else 'なし / None'
-            embed.add_field(name="タグ / Tags", value=tags_display, inline=False)
-            
-            # 画像をプレビュー表示
-            if self.form_data['image_url']:
-                embed.set_image(url=self.form_data['image_url'])
-            
+            embed = build_registration_confirmation_embed(self.form_data, selected_tag_names)
             view = ConfirmationView(self.form_data)
-            await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+            await bot.sender.followup(interaction, embed=embed, view=view, ephemeral=True)
             
         except Exception as e:
-            await interaction.followup.send(f"エラーが発生しました: {str(e)}", ephemeral=True)
+            await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 class ConfirmationView(discord.ui.View):
     """最終確認ビュー"""
@@ -615,6 +1172,8 @@ class ConfirmationView(discord.ui.View):
     def __init__(self, form_data):
         super().__init__(timeout=300)
         self.form_data = form_data
+        # 登録ボタンを何度押しても1件の申請になるよう、確認画面ごとに冪等キーを持つ
+        self.idempotency_key = uuid.uuid4().hex
     
     @discord.ui.button(label="登録する / Register", style=discord.ButtonStyle.success, emoji="✅")
     async def confirm_registration(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -622,41 +1181,29 @@ class ConfirmationView(discord.ui.View):
         try:
             await interaction.response.defer(ephemeral=True)
             
-            # GASに送信
-            gas_client = GASClient()
-            result = await gas_client.register_formula(self.form_data)
+            # アウトボックスに保存（GASへの送信・再試行はバックグラウンドで行う）
+            entry = await asyncio.to_thread(bot.registration_outbox.enqueue, self.form_data, self.idempotency_key, interaction.user.id)
+            bot.kick_registration_outbox()
             
-            if result.get('success'):
-                # 成功
-                formula_id = result.get('result', {}).get('id', '不明')
-                embed = discord.Embed(
-                    title="登録申請完了 / Registration Request Complete",
-                    description=(
-                        "✅ 数式の登録申請が完了しました！\n"
-                        "\n"
-                        "この数式は運営による精査後、毎日0:10(JST)に正式登録されます。\n"
-                        "（不適切な内容の場合は登録されません）\n"
-                        "\n"
-                        "---\n"
-                        "✅ Your formula registration request has been received!\n"
-                        "\n"
-                        "This formula will be reviewed by the admin and officially registered at 00:10 (JST) each day.\n"
-                        "(If the content is inappropriate, it will not be registered.)"
-                    ),
-                    color=0x00FF00
-                )
-                embed.add_field(name="ID", value=str(formula_id), inline=False)
-                embed.set_footer(text="Graph + Library = Graphary")
-                await interaction.followup.send(embed=embed, ephemeral=True)
-            else:
-                # 失敗
-                error_msg = result.get('error', '不明なエラー')
-                embed = discord.Embed(
-                    title="登録失敗 / Registration Failed",
-                    description=f"❌ 数式の登録に失敗しました。\nFailed to register formula.\n\nエラー/Error: {error_msg}",
-                    color=0xFF0000
-                )
-                await interaction.followup.send(embed=embed, ephemeral=True)
+            embed = discord.Embed(
+                title="登録申請受付 / Registration Request Received",
+                description=(
+                    "✅ 数式の登録申請を受け付けました！\n"
+                    "\n"
+                    "この数式は運営による精査後、毎日0:10(JST)に正式登録されます。\n"
+                    "（不適切な内容の場合は登録されません）\n"
+                    "\n"
+                    "---\n"
+                    "✅ Your formula registration request has been received!\n"
+                    "\n"
+                    "This formula will be reviewed by the admin and officially registered at 00:10 (JST) each day.\n"
+                    "(If the content is inappropriate, it will not be registered.)"
+                ),
+                color=0x00FF00
+            )
+            embed.add_field(name="受付番号 / Request ID", value=f"#{entry.id}", inline=False)
+            embed.set_footer(text="Graph + Library = Graphary")
+            await bot.sender.followup(interaction, embed=embed, ephemeral=True)
                 
         except Exception as e:
             embed = discord.Embed(
@@ -664,7 +1211,7 @@ class ConfirmationView(discord.ui.View):
                 description=f"❌ 予期しないエラーが発生しました。\nAn unexpected error occurred.\n\nエラー/Error: {str(e)}",
                 color=0xFF0000
             )
-            await interaction.followup.send(embed=embed, ephemeral=True)
+            await bot.sender.followup(interaction, embed=embed, ephemeral=True)
     
     @discord.ui.button(label="キャンセル / Cancel", style=discord.ButtonStyle.secondary, emoji="❌")
     async def cancel_registration(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -676,40 +1223,114 @@ class ConfirmationView(discord.ui.View):
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-@app_commands.default_permissions(administrator=True)
-@bot.tree.command(name="list_messages", description="管理者限定：利用可能なメッセージキー一覧を表示")
-async def list_messages_command(interaction: discord.Interaction):
-    """管理者限定：利用可能なメッセージキー一覧を表示"""
+# /list_messages の1ページあたりのキー数（Embedのフィールド上限25件以内）
+MESSAGE_LIST_PAGE_SIZE = 10
+
+class MessageListView(discord.ui.View):
+    """メッセージキー一覧のページ送りビュー（表示するページだけEmbedを作成）"""
     
-    # 管理者チェック
-    if not is_admin(interaction):
-        await interaction.response.send_message("このコマンドを使用する権限がありません。", ephemeral=True)
-        return
+    def __init__(self, user_id, prefix=None):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.prefix = prefix
+        self.page = 0
+        self._update_buttons()
+    
+    @property
+    def keys(self):
+        """表示対象のキー（キャッシュのソート済みキー一覧から取得）"""
+        return bot.message_cache.keys(self.prefix)
+    
+    @property
+    def page_count(self):
+        return max((len(self.keys) + MESSAGE_LIST_PAGE_SIZE - 1) // MESSAGE_LIST_PAGE_SIZE, 1)
     
-    messages = get_all_messages()
-    if messages:
+    def _update_buttons(self):
+        """ページ位置に応じてボタンの有効・無効を切り替え"""
+        # 表示中にメッセージが削除されてページ数が減った場合は最後のページに寄せる
+        self.page = min(self.page, self.page_count - 1)
+        self.prev_button.disabled = self.page <= 0
+        self.next_button.disabled = self.page >= self.page_count - 1
+    
+    def render_page(self):
+        """現在のページのEmbedを作成"""
+        keys = self.keys
+        start = self.page * MESSAGE_LIST_PAGE_SIZE
         embed = discord.Embed(
             title="📝 利用可能なメッセージキー",
             color=discord.Color.blue()
         )
-        for msg in messages:
-            key = msg.get("key")
-            content = msg.get("content", "")
-            # コンテンツが長い場合は短縮
-            if len(content) > 100:
-                content = content[:100] + "..."
+        for key in keys[start:start + MESSAGE_LIST_PAGE_SIZE]:
+            msg = bot.message_cache.peek(key)
+            if not msg:
+                continue
+            # 1ページ分（MESSAGE_LIST_PAGE_SIZE件）がEmbedの合計上限に収まるように短縮
+            content = truncate(msg.get("content", ""), 103)
             embed_info = ""
             embed_data = msg.get("embed", {})
             if embed_data:
-                embed_info = f"\n**Embed:** {embed_data.get('title', 'タイトルなし')}"
+                embed_info = f"\n**Embed:** {truncate(embed_data.get('title', 'タイトルなし'), 103)}"
             embed.add_field(
-                name=f"`{key}`",
+                name=truncate(f"`{key}`", MAX_FIELD_NAME_LENGTH),
                 value=f"**Content:** {content}{embed_info}",
                 inline=False
             )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-    else:
-        await interaction.response.send_message("登録されているメッセージがありません。", ephemeral=True)
+        
+        prefix_info = f" | 「{self.prefix}」で始まるキー" if self.prefix else ""
+        embed.set_footer(text=f"{len(keys)}件{prefix_info} | {self.page + 1}/{self.page_count}")
+        return embed
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """コマンドを実行した本人だけがページを送れる"""
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("この一覧は操作できません。/list_messages を実行してください。", ephemeral=True)
+            return False
+        return True
+    
+    @discord.ui.button(label="◀ 前へ / Prev", style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        """前のページ"""
+        self.page = max(self.page - 1, 0)
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.render_page(), view=self)
+    
+    @discord.ui.button(label="次へ / Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        """次のページ"""
+        self.page += 1
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.render_page(), view=self)
+
+@app_commands.default_permissions(administrator=True)
+@bot.tree.command(name="list_messages", description="管理者限定：利用可能なメッセージキー一覧を表示")
+@app_commands.describe(prefix="この文字列で始まるキーだけを表示（オプション）")
+async def list_messages_command(interaction: discord.Interaction, prefix: str = None):
+    """管理者限定：利用可能なメッセージキー一覧を表示"""
+    
+    # 管理者チェック
+    if not is_admin(interaction):
+        await interaction.response.send_message("このコマンドを使用する権限がありません。", ephemeral=True)
+        return
+    
+    try:
+        await interaction.response.defer(ephemeral=True)
+        
+        await bot.message_cache.ensure_loaded()
+        prefix = prefix.strip() if prefix else None
+        if not bot.message_cache.keys(prefix):
+            if prefix:
+                await bot.sender.followup(interaction, f"「{prefix}」で始まるメッセージキーはありません。", ephemeral=True)
+            else:
+                await bot.sender.followup(interaction, "登録されているメッセージがありません。", ephemeral=True)
+            return
+        
+        view = MessageListView(interaction.user.id, prefix)
+        if view.page_count > 1:
+            await bot.sender.followup(interaction, embed=view.render_page(), view=view, ephemeral=True)
+        else:
+            await bot.sender.followup(interaction, embed=view.render_page(), ephemeral=True)
+    except Exception as e:
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 @app_commands.default_permissions(administrator=True)
 @bot.tree.command(name="edit_message", description="管理者限定：登録済みメッセージを編集")
@@ -736,10 +1357,12 @@ async def edit_message_command(
         return
     
     try:
+        await interaction.response.defer(ephemeral=True)
+        
         # 既存のメッセージを取得
-        existing_message = get_message(message_key)
+        existing_message = await bot.message_cache.get(message_key)
         if not existing_message:
-            await interaction.response.send_message(f"メッセージキー '{message_key}' が見つかりません。", ephemeral=True)
+            await bot.sender.followup(interaction, f"メッセージキー '{message_key}' が見つかりません。", ephemeral=True)
             return
         
         # 新しいメッセージデータを作成
@@ -764,8 +1387,7 @@ async def edit_message_command(
                 updated_message["embed"]["color"] = new_embed_color
         
         # メッセージを更新（スプレッドシートAPIで更新）
-        from messages_gspread import add_or_update_message
-        success = add_or_update_message(message_key, updated_message["content"], updated_message.get("embed", {}))
+        success = await bot.message_cache.put(message_key, updated_message["content"], updated_message.get("embed", {}))
         
         # 確認メッセージを送信
         embed = discord.Embed(
@@ -784,10 +1406,10 @@ async def edit_message_command(
             embed_info += f"**色:** {embed_data.get('color', 'なし')}"
             embed.add_field(name="Embed情報", value=embed_info, inline=False)
         
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        await bot.sender.followup(interaction, embed=embed, ephemeral=True)
         
     except Exception as e:
-        await interaction.response.send_message(f"エラーが発生しました: {str(e)}", ephemeral=True)
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 @app_commands.default_permissions(administrator=True)
 @bot.tree.command(name="add_message", description="管理者限定：新しいメッセージキーを追加")
@@ -814,10 +1436,12 @@ async def add_message_command(
         return
     
     try:
+        await interaction.response.defer(ephemeral=True)
+        
         # 既存のキーかチェック
-        existing_message = get_message(message_key)
+        existing_message = await bot.message_cache.get(message_key)
         if existing_message:
-            await interaction.response.send_message(f"メッセージキー '{message_key}' は既に存在します。編集したい場合は `/edit_message` を使用してください。", ephemeral=True)
+            await bot.sender.followup(interaction, f"メッセージキー '{message_key}' は既に存在します。編集したい場合は `/edit_message` を使用してください。", ephemeral=True)
             return
         
         # 新しいメッセージデータを作成
@@ -835,8 +1459,7 @@ async def add_message_command(
             new_message["embed"] = embed_data
         
         # メッセージを追加（スプレッドシートAPIで追加）
-        from messages_gspread import add_or_update_message
-        success = add_or_update_message(message_key, new_message["content"], new_message.get("embed", {}))
+        success = await bot.message_cache.put(message_key, new_message["content"], new_message.get("embed", {}))
         
         # 確認メッセージを送信
         embed = discord.Embed(
@@ -855,12 +1478,12 @@ async def add_message_command(
             embed_info += f"**色:** {embed_data.get('color', 'なし')}"
             embed.add_field(name="Embed情報", value=embed_info, inline=False)
         
-        embed.set_footer(text="⚠️ 注意: Bot再起動時に変更は失われます")
+        embed.set_footer(text="シートへの反映はバックグラウンドで行われます")
         
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        await bot.sender.followup(interaction, embed=embed, ephemeral=True)
         
     except Exception as e:
-        await interaction.response.send_message(f"エラーが発生しました: {str(e)}", ephemeral=True)
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 @app_commands.default_permissions(administrator=True)
 @bot.tree.command(name="remove_message", description="管理者限定：メッセージキーを削除")
@@ -879,15 +1502,19 @@ async def remove_message_command(
         return
     
     try:
+        await interaction.response.defer(ephemeral=True)
+        
         # メッセージが存在するかチェック
-        existing_message = get_message(message_key)
+        existing_message = await bot.message_cache.get(message_key)
         if not existing_message:
-            await interaction.response.send_message(f"メッセージキー '{message_key}' が見つかりません。", ephemeral=True)
+            await bot.sender.followup(interaction, f"メッセージキー '{message_key}' が見つかりません。", ephemeral=True)
             return
         
         # メッセージを削除（スプレッドシートAPIで削除）
-        from messages_gspread import remove_message
-        success = remove_message(message_key)
+        success = await bot.message_cache.remove(message_key)
+        if not success:
+            await bot.sender.followup(interaction, f"メッセージキー '{message_key}' を削除できませんでした。", ephemeral=True)
+            return
         
         # 確認メッセージを送信
         embed = discord.Embed(
@@ -895,12 +1522,12 @@ async def remove_message_command(
             description=f"メッセージキー `{message_key}` を削除しました。",
             color=discord.Color.red()
         )
-        embed.set_footer(text="⚠️ 注意: Bot再起動時に変更は失われます")
+        embed.set_footer(text="シートへの反映はバックグラウンドで行われます")
         
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+        await bot.sender.followup(interaction, embed=embed, ephemeral=True)
         
     except Exception as e:
-        await interaction.response.send_message(f"エラーが発生しました: {str(e)}", ephemeral=True)
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 @app_commands.default_permissions(administrator=True)
 @bot.tree.command(name="edit_bot_message", description="管理者限定：Botが送信した過去のメッセージを編集")
@@ -993,9 +1620,9 @@ async def edit_bot_message_command(
         
         # メッセージを編集
         if edited_embed:
-            await message.edit(content=edited_content, embed=edited_embed)
+            await bot.sender.edit(message, content=edited_content, embed=edited_embed, priority=PRIORITY_INTERACTIVE)
         else:
-            await message.edit(content=edited_content)
+            await bot.sender.edit(message, content=edited_content, priority=PRIORITY_INTERACTIVE)
         
         # 確認メッセージを送信
         confirm_embed = discord.Embed(
@@ -1136,14 +1763,13 @@ async def extract_embed_text_command(
         plain_text = "\n".join(text_parts)
         if not plain_text:
             plain_text = "Embedに表示可能なテキストがありません。"
-        # 2000文字ごとに分割して送信
-        max_length = 2000
-        chunks = [plain_text[i:i+max_length] for i in range(0, len(plain_text), max_length)]
+        # コードブロックに入れて、行の区切りで2000文字以内に分割して送信（分割位置でコードブロックを閉じ直す）
+        chunks = split_text(f"```\n{plain_text}\n```")
         for idx, chunk in enumerate(chunks):
             if idx == 0:
-                await interaction.response.send_message(f"```{chunk}```", ephemeral=True)
+                await interaction.response.send_message(chunk, ephemeral=True)
             else:
-                await interaction.followup.send(f"```{chunk}```", ephemeral=True)
+                await bot.sender.followup(interaction, chunk, ephemeral=True)
     except Exception as e:
         await interaction.response.send_message(f"エラーが発生しました: {str(e)}", ephemeral=True)
 
@@ -1160,69 +1786,16 @@ async def send_formula_notification_command(interaction: discord.Interaction):
     try:
         await interaction.response.defer(ephemeral=True)
         
-        # Firebaseから今日の数式を取得
-        firebase_client = FirebaseClient()
-        today_formulas = firebase_client.get_today_formulas()
+        # 未通知の数式を送信（定期通知と同じウォーターマークを使用、通知チャンネル以外では通知済みにしない）
+        count = await bot.run_formula_notification(interaction.channel)
         
-        if not today_formulas:
-            # 今日登録された数式がない場合
-            embed = discord.Embed(
-                title="今日の数式登録",
-                description="今日はまだ新しい数式が登録されていません。",
-                color=0x888888
-            )
-            embed.set_footer(text="Graph + Library = Graphary")
-            await interaction.channel.send(embed=embed)
-            await interaction.followup.send("通知を送信しました（今日の登録なし）", ephemeral=True)
-            return
-        
-        # 数式が登録されている場合 - 各数式を個別のEmbedで送信
-        for i, formula_data in enumerate(today_formulas):
-            formatted_data = firebase_client.format_formula_for_discord(formula_data)
-            
-            # 個別のEmbedを作成
-            embed = discord.Embed(
-                title=formatted_data['title'],
-                description=f"```\n{formatted_data['formula']}\n```",
-                color=0x00FF7F,
-                url=f"https://teth-main.github.io/Graphary/?formulaId={formatted_data['id']}"
-            )
-            
-            # 数式タイプを追加
-            if formatted_data['formula_type']:
-                type_list = "\n".join([f"`{t}`" for t in formatted_data['formula_type'].split(', ')])
-                embed.add_field(
-                    name="数式タイプ",
-                    value=type_list,
-                    inline=True
-                )
-            
-            # タグを追加
-            if formatted_data['tags'] and formatted_data['tags'] != 'なし':
-                tag_list = "\n".join([f"`{t}`" for t in formatted_data['tags'].split(', ')])
-                embed.add_field(
-                    name="タグ",
-                    value=tag_list,
-                    inline=True
-                )
-            
-            # 画像を設定（必ずあるので大きく表示）
-            if formatted_data['image_url']:
-                embed.set_image(url=formatted_data['image_url'])
-            
-            embed.set_footer(text="Graph + Library = Graphary")
-            
-            await interaction.channel.send(embed=embed)
-            
-            # 連続送信の間隔を少し空ける
-            if i < len(today_formulas) - 1:
-                import asyncio
-                await asyncio.sleep(1)
-        
-        await interaction.followup.send(f"今日の数式通知を送信しました: {len(today_formulas)}件", ephemeral=True)
+        if count:
+            await bot.sender.followup(interaction, f"新しい数式の通知を送信しました: {count}件", ephemeral=True)
+        else:
+            await bot.sender.followup(interaction, "通知を送信しました（新しい登録なし）", ephemeral=True)
         
     except Exception as e:
-        await interaction.followup.send(f"エラーが発生しました: {str(e)}", ephemeral=True)
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 @app_commands.default_permissions(administrator=True)
 @bot.tree.command(name="test_formula_embed", description="管理者限定：数式通知のEmbedスタイルをテスト表示")
@@ -1271,38 +1844,22 @@ async def test_formula_embed_command(interaction: discord.Interaction):
             }
         ]
         
-        # テスト用Embedを作成（実際の通知と同じスタイル）
-        embed = discord.Embed(
-            title="サンプル数式1：美しい螺旋",
-            description="```\nr = a * theta^2 + b * sin(c * theta)\n```",
-            color=0x00FF7F,
-            url="https://teth-main.github.io/Graphary/?formulaId=test001"
-        )
-        
-        # 数式タイプを追加
-        embed.add_field(
-            name="数式タイプ",
-            value="`極座標`\n`螺旋`",
-            inline=True
-        )
-        
-        # タグを追加
-        embed.add_field(
-            name="タグ",
-            value="`美しい`\n`螺旋`\n`数学アート`",
-            inline=True
-        )
+        # テスト用Embedを作成（実際の通知と同じレンダラーを使用）
+        sample = sample_formulas[0]
+        embed = create_formula_embed({
+            'id': sample['id'],
+            'title': sample['title'],
+            'formula': sample['formula'],
+            'formula_type': ', '.join(sample['formula_type']),
+            'tags': ', '.join(sample['tags']),
+            'image_url': sample['image_url']
+        })
         
-        # 画像を設定（大きく表示）
-        embed.set_image(url="https://via.placeholder.com/600x400/FF6B6B/FFFFFF?text=Sample+Formula+1")
-        
-        embed.set_footer(text="Graph + Library = Graphary")
-        
-        await interaction.channel.send(embed=embed)
-        await interaction.followup.send("テスト用のEmbed表示を送信しました（新スタイル）。", ephemeral=True)
+        await bot.sender.send(interaction.channel, embed=embed, priority=PRIORITY_INTERACTIVE)
+        await bot.sender.followup(interaction, "テスト用のEmbed表示を送信しました（新スタイル）。", ephemeral=True)
         
     except Exception as e:
-        await interaction.followup.send(f"エラーが発生しました: {str(e)}", ephemeral=True)
+        await bot.sender.followup(interaction, f"エラーが発生しました: {str(e)}", ephemeral=True)
 
 @app_commands.default_permissions(administrator=True)
 @bot.tree.command(name="check_formula_status", description="管理者限定：現在のFirebase接続状況と今日の数式登録状況を確認")
@@ -1319,17 +1876,18 @@ async def check_formula_status_command(interaction: discord.Interaction):
         
         # Firebase接続テスト
         try:
-            firebase_client = FirebaseClient()
+            firebase_client = bot.firebase_client
+            if not await firebase_client.check_health(force=True):
+                raise ConnectionError("Firestoreに接続できません")
             connection_status = "✅ 正常"
         except Exception as e:
             connection_status = f"❌ エラー: {str(e)}"
-            await interaction.followup.send(f"Firebase接続エラー: {str(e)}", ephemeral=True)
+            await bot.sender.followup(interaction, f"Firebase接続エラー: {str(e)}", ephemeral=True)
             return
         
         # 今日の数式取得テスト
         try:
-            today_formulas = firebase_client.get_today_formulas()
-            formula_count = len(today_formulas)
+            formula_count = await firebase_client.count_today_formulas()
             formula_status = f"✅ 今日の登録: {formula_count}件"
         except Exception as e:
             formula_status = f"❌ 取得エラー: {str(e)}"
@@ -1394,13 +1952,57 @@ async def check_formula_status_command(interaction: discord.Interaction):
         )
         
         # 次回通知予定時刻
-        from datetime import datetime
         jst = timezone(timedelta(hours=9))
         now_jst = datetime.now(jst)
         next_notification = now_jst.replace(hour=0, minute=0, second=0, microsecond=0)
         if next_notification <= now_jst:
             next_notification += timedelta(days=1)
         
+        embed.add_field(
+            name="ランダム表示Embedプール",
+            value=bot.random_embed_pool.stats() if bot.random_embed_pool.enabled else "無効",
+            inline=False
+        )
+        
+        embed.add_field(
+            name="数式Embedレンダラー",
+            value=formula_renderer.cache_stats(),
+            inline=False
+        )
+        
+        embed.add_field(
+            name="送信キュー",
+            value=bot.sender.stats(),
+            inline=False
+        )
+        
+        embed.add_field(
+            name="GASタグキャッシュ",
+            value=bot.tag_cache.stats(),
+            inline=False
+        )
+        
+        embed.add_field(
+            name="メッセージテンプレート",
+            value=bot.message_cache.stats(),
+            inline=False
+        )
+        
+        embed.add_field(
+            name="登録申請アウトボックス",
+            value=await asyncio.to_thread(bot.registration_outbox.stats),
+            inline=False
+        )
+        
+        # 通知ウォーターマーク
+        state = bot.notification_state
+        watermark = state.last_timestamp.astimezone(JST).strftime('%Y/%m/%d %H:%M:%S') if state.last_timestamp else "未設定"
+        embed.add_field(
+            name="通知ウォーターマーク",
+            value=f"最終通知: {watermark} (JST) | 最終定期実行: {state.last_run_date or 'なし'}",
+            inline=False
+        )
+        
         embed.add_field(
             name="次回自動通知予定",
             value=f"🕐 {next_notification.strftime('%Y/%m/%d %H:%M:%S')} (JST)",
@@ -1410,10 +2012,10 @@ async def check_formula_status_command(interaction: discord.Interaction):
         embed.set_footer(text="Math Graph Art - System Status")
         embed.timestamp = discord.utils.utcnow()
         
-        await interaction.followup.send(embed=embed, ephemeral=True)
+        await bot.sender.followup(interaction, embed=embed, ephemeral=True)
         
     except Exception as e:
-        await interaction.followup.send(f"ステータス確認エラー: {str(e)}", ephemeral=True)
+        await bot.sender.followup(interaction, f"ステータス確認エラー: {str(e)}", ephemeral=True)
 
 # 誰でも使える: 個人用ダイスコマンド
 @bot.tree.command(name="dice_seacret", description="個人用ダイス: minからmaxの間でランダムな数字を表示します")
@@ -0,0 +1,295 @@
+"""
+メッセージテンプレートのローカルファーストなストア
+読み込みはローカル（メモリ + SQLite）だけで完結し、追加・編集・削除もまずローカルに保存する
+シートとの同期（未送信の変更の送信・シート側の変更の取り込み）はバックグラウンドで行う
+未送信の変更とシート側の内容が食い違う場合、シートが更新時刻（updated_at / timestamp）を
+返していれば新しい方を採用し、返していなければローカルの変更を優先して競合として数える
+"""
+
+import asyncio
+import bisect
+import time
+from datetime import datetime
+
+import messages_gspread
+from message_store import MessageStore, StoredMessage
+
+
+def _remote_timestamp(message):
+    """シートの行の更新時刻（updated_at / timestamp 列）をUNIX時刻で取得（無ければNone）"""
+    value = message.get('updated_at') or message.get('timestamp')
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        # Apps Script はミリ秒で返すことがある
+        return value / 1000 if value > 1e11 else float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+class MessageTemplateCache:
+    def __init__(self, store=None):
+        """
+        ローカルに保存済みのメッセージを読み込む（シートに接続できなくてもすぐに使える）
+
+        Args:
+            store (MessageStore): ローカル保存（省略時は既定のパスに作成）
+        """
+        self.store = store or MessageStore()
+        # キー -> StoredMessage（削除済みの印も含む）
+        self._entries = self.store.load_all()
+        # 一度もシートから取り込んでいなければ、読み込みはシートに問い合わせる
+        self.loaded = self.store.last_pulled_at is not None
+        # ローカルの内容が変わるたびに増える
+        self.version = 0
+        self._sync_lock = asyncio.Lock()
+        self._sync_tasks = set()
+        # SQLiteへの書き込みはスレッドで行い、呼び出し順に反映されるようロックで直列化する
+        self._store_lock = asyncio.Lock()
+        # ソート済みのキー一覧（versionが変わったら作り直す）
+        self._sorted_keys = None
+        self._sorted_version = -1
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    def __len__(self):
+        return sum(1 for entry in self._entries.values() if not entry.deleted)
+
+    @property
+    def pending(self):
+        """シートに未送信の変更の数"""
+        return sum(1 for entry in self._entries.values() if entry.dirty)
+
+    # --- 読み込み（ローカルのみ） ---
+
+    async def get(self, key):
+        """
+        キーのメッセージを取得（一度もシートから取り込んでいなければシートに問い合わせる）
+
+        Returns:
+            dict: メッセージデータ、存在しない場合はNone
+        """
+        if self.loaded:
+            self.hits += 1
+            entry = self._entries.get(key)
+            return entry.to_message() if entry and not entry.deleted else None
+
+        # 取り込み前でもローカルの未送信の変更（削除を含む）はシートより優先する
+        entry = self._entries.get(key)
+        if entry is not None and entry.dirty:
+            self.hits += 1
+            return None if entry.deleted else entry.to_message()
+
+        self.misses += 1
+        return await messages_gspread.get_message(key)
+
+    async def all(self):
+        """
+        全メッセージをキー順に取得（一度もシートから取り込んでいなければ先に同期する）
+
+        Returns:
+            list: メッセージデータのリスト
+        """
+        await self.ensure_loaded()
+        return [self._entries[key].to_message() for key in self.keys()]
+
+    async def ensure_loaded(self):
+        """一度もシートから取り込んでいなければ同期する"""
+        if not self.loaded:
+            await self.sync()
+
+    def keys(self, prefix=None):
+        """
+        削除されていないキーをソートして取得
+
+        Args:
+            prefix (str): 指定した場合はこの文字列で始まるキーだけを返す
+
+        Returns:
+            list: キーのリスト（呼び出し側で変更しないこと）
+        """
+        if self._sorted_keys is None or self._sorted_version != self.version:
+            self._sorted_keys = sorted(key for key, entry in self._entries.items() if not entry.deleted)
+            self._sorted_version = self.version
+        if not prefix:
+            return self._sorted_keys
+        # ソート済みなので前方一致する範囲を二分探索で切り出す
+        start = bisect.bisect_left(self._sorted_keys, prefix)
+        end = start
+        while end < len(self._sorted_keys) and self._sorted_keys[end].startswith(prefix):
+            end += 1
+        return self._sorted_keys[start:end]
+
+    def peek(self, key):
+        """ローカルのメッセージを取得（シートには問い合わせない）"""
+        entry = self._entries.get(key)
+        return entry.to_message() if entry and not entry.deleted else None
+
+    # --- 書き込み（ローカルに保存してから裏でシートへ送信） ---
+
+    async def put(self, key, content, embed=None):
+        """
+        メッセージを追加・更新
+
+        Returns:
+            bool: ローカルに保存できた場合はTrue（シートへの送信はバックグラウンド）
+        """
+        entry = StoredMessage(key, content, dict(embed) if embed else None, time.time(), dirty=True)
+        await self._set_local(entry)
+        return True
+
+    async def remove(self, key):
+        """
+        メッセージを削除（シートに反映するまで削除済みの印を残す）
+
+        一度もシートから取り込んでいない間はローカルに無いキーも削除済みの印を残す
+        （シートにだけ存在するキーの削除を次の同期で送るため）。
+
+        Returns:
+            bool: 削除するメッセージがあった場合はTrue
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry.deleted:
+            return False
+        if entry is None and self.loaded:
+            return False
+        await self._set_local(StoredMessage(key, '', None, time.time(), dirty=True, deleted=True))
+        return True
+
+    async def _set_local(self, entry):
+        """ローカルに保存して同期を予約"""
+        self._entries[entry.key] = entry
+        self.version += 1
+        await self._write(self.store.save, entry)
+        self._schedule_sync()
+
+    async def _write(self, func, *args):
+        """SQLiteへの書き込みをイベントループの外で実行"""
+        async with self._store_lock:
+            await asyncio.to_thread(func, *args)
+
+    def _schedule_sync(self):
+        """バックグラウンドでの同期を開始"""
+        try:
+            task = asyncio.create_task(self._sync_quietly())
+        except RuntimeError:
+            # イベントループ外では次の定期同期に任せる
+            return
+        self._sync_tasks.add(task)
+        task.add_done_callback(self._sync_tasks.discard)
+
+    async def _sync_quietly(self):
+        try:
+            await self.sync()
+        except Exception as e:
+            print(f"メッセージテンプレート同期エラー: {e}")
+
+    async def close(self):
+        """バックグラウンドの同期を止めてからローカル保存を閉じる"""
+        for task in list(self._sync_tasks):
+            task.cancel()
+        await asyncio.gather(*self._sync_tasks, return_exceptions=True)
+        await asyncio.to_thread(self.store.close)
+
+    # --- シートとの同期 ---
+
+    async def sync(self):
+        """
+        シートと同期（未送信の変更を送ってから、シートの内容を取り込む）
+
+        シートに接続できない場合は例外を送出し、ローカルの内容はそのまま残す。
+        """
+        async with self._sync_lock:
+            await self._push()
+            await self._pull()
+
+    async def _push(self):
+        """未送信の変更をシートに送信"""
+        # 削除に失敗したときに確認するシートのキー一覧（必要になったら1回だけ取得）
+        remote_keys = None
+        for entry in [entry for entry in self._entries.values() if entry.dirty]:
+            if entry.deleted:
+                success = await messages_gspread.remove_message(entry.key)
+                if not success:
+                    # シートに届く前に削除されたキーは、シートに無ければ削除済みとみなす
+                    if remote_keys is None:
+                        remote_keys = {
+                            str(message.get('key')) for message in await messages_gspread.fetch_all_messages()
+                            if isinstance(message, dict)
+                        }
+                    success = entry.key not in remote_keys
+            else:
+                success = await messages_gspread.add_or_update_message(
+                    entry.key, entry.content, entry.embed, updated_at=entry.updated_at
+                )
+            if not success:
+                print(f"メッセージテンプレート '{entry.key}' の送信に失敗しました")
+                continue
+
+            # 送信中にローカルで更に変更されていなければ送信済みにする
+            if self._entries.get(entry.key) is not entry:
+                continue
+            if entry.deleted:
+                del self._entries[entry.key]
+                await self._write(self.store.delete, entry.key)
+            else:
+                entry.dirty = False
+                await self._write(self.store.save, entry)
+
+    async def _pull(self):
+        """シートの内容を取り込む（未送信の変更との競合の扱いはモジュールの説明を参照）"""
+        pulled_at = time.time()
+        messages = await messages_gspread.fetch_all_messages()
+
+        remote = {
+            str(message['key']): message
+            for message in messages if isinstance(message, dict) and message.get('key')
+        }
+
+        changed = []
+        removed = []
+        for key, message in remote.items():
+            remote_at = _remote_timestamp(message)
+            local = self._entries.get(key)
+            embed = message.get('embed') or None
+            content = message.get('content', '')
+            if local is not None and local.dirty:
+                if not local.deleted and local.content == content and local.embed == embed:
+                    continue
+                # ローカルの未送信の変更と競合: 更新時刻が分かりシートの方が新しい場合だけシートを採用
+                self.conflicts += 1
+                if remote_at is None or remote_at <= local.updated_at:
+                    print(f"メッセージテンプレート '{key}' がシートでも変更されています（ローカルの変更を優先）")
+                    continue
+                print(f"メッセージテンプレート '{key}' はシートの変更の方が新しいため、ローカルの変更を破棄しました")
+            if local is not None and not local.dirty and not local.deleted \
+                    and local.content == content and local.embed == embed:
+                continue
+            entry = StoredMessage(key, content, embed, remote_at or pulled_at)
+            self._entries[key] = entry
+            changed.append(entry)
+
+        # シートから消えたメッセージ（ローカルに未送信の変更が無いもの）は削除
+        for key, local in list(self._entries.items()):
+            if key not in remote and not local.dirty:
+                del self._entries[key]
+                removed.append(key)
+
+        await self._write(self.store.save_many, changed, removed)
+        await self._write(self.store.mark_pulled, pulled_at)
+        if changed or removed:
+            self.version += 1
+        self.loaded = True
+
+    def stats(self):
+        """メトリクスを文字列で取得"""
+        state = f"{len(self)}件" if self.loaded else "未同期"
+        return (
+            f"メッセージ: {state} | 未送信: {self.pending} | 競合: {self.conflicts} | "
+            f"ヒット: {self.hits} | ミス: {self.misses}"
+        )
@@ -0,0 +1,147 @@
+"""
+メッセージテンプレートのローカル保存（SQLite）
+シートと同期するための更新時刻・未送信フラグ・削除済みの印（tombstone）も一緒に記録する
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 保存先
+STORE_PATH = os.getenv('MESSAGE_STORE_PATH', 'data/messages.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    key TEXT PRIMARY KEY,
+    content TEXT NOT NULL DEFAULT '',
+    embed TEXT,
+    updated_at REAL NOT NULL,
+    dirty INTEGER NOT NULL DEFAULT 0,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class StoredMessage:
+    __slots__ = ('key', 'content', 'embed', 'updated_at', 'dirty', 'deleted')
+
+    def __init__(self, key, content, embed, updated_at, dirty=False, deleted=False):
+        self.key = key
+        self.content = content
+        self.embed = embed
+        self.updated_at = updated_at
+        self.dirty = dirty
+        self.deleted = deleted
+
+    def to_message(self):
+        """メッセージAPIと同じ形式の辞書に変換"""
+        message = {'key': self.key, 'content': self.content}
+        if self.embed:
+            message['embed'] = dict(self.embed)
+        return message
+
+
+class MessageStore:
+    def __init__(self, path=STORE_PATH):
+        """
+        ローカル保存を開く（ファイルが無ければ作成）
+
+        メソッドはすべて同期的に実行されるため、イベントループからは
+        MessageTemplateCache のように asyncio.to_thread 経由で呼び出す。
+        書き込み中に close() が呼ばれても書き込みが終わるのを待つよう、内部でロックする。
+
+        Args:
+            path (str): SQLiteファイルのパス
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.RLock()
+
+    def close(self):
+        """データベースを閉じる"""
+        with self._lock:
+            self._conn.close()
+
+    def load_all(self):
+        """
+        保存済みのメッセージを全て読み込む（削除済みの印も含む）
+
+        Returns:
+            dict: キー -> StoredMessage
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, content, embed, updated_at, dirty, deleted FROM messages"
+            ).fetchall()
+        return {
+            key: StoredMessage(key, content, json.loads(embed) if embed else None, updated_at, bool(dirty), bool(deleted))
+            for key, content, embed, updated_at, dirty, deleted in rows
+        }
+
+    def save(self, message):
+        """メッセージ（または削除済みの印）を保存"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO messages (key, content, embed, updated_at, dirty, deleted) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    message.key,
+                    message.content or '',
+                    json.dumps(message.embed, ensure_ascii=False) if message.embed else None,
+                    message.updated_at,
+                    int(message.dirty),
+                    int(message.deleted),
+                )
+            )
+
+    def save_many(self, messages, deleted_keys=()):
+        """複数のメッセージの保存とキーの削除を1トランザクションで行う"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages (key, content, embed, updated_at, dirty, deleted) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        message.key,
+                        message.content or '',
+                        json.dumps(message.embed, ensure_ascii=False) if message.embed else None,
+                        message.updated_at,
+                        int(message.dirty),
+                        int(message.deleted),
+                    )
+                    for message in messages
+                ]
+            )
+            self._conn.executemany("DELETE FROM messages WHERE key = ?", [(key,) for key in deleted_keys])
+
+    def delete(self, key):
+        """キーの行を完全に削除（削除済みの印をシートに反映し終えたとき）"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE key = ?", (key,))
+
+    @property
+    def last_pulled_at(self):
+        """最後にシートから取り込んだ時刻（未取り込みならNone）"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'last_pulled_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def mark_pulled(self, pulled_at=None):
+        """シートから取り込んだ時刻を記録"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('last_pulled_at', ?)",
+                (str(pulled_at if pulled_at is not None else time.time()),)
+            )
@@ -1,39 +1,103 @@
 """
 Google Sheets（GAS API）でメッセージ管理を行うためのラッパー
 .envにAPI_URL, API_KEY等を設定して利用してください
+（aiohttpを使用し、全関数はコルーチンとして呼び出す）
 """
 import os
-import requests
+import asyncio
+import aiohttp
+from datetime import datetime, timezone
+from http_session import create_http_session
 
 API_URL = os.getenv("MESSAGES_API_URL")  # 例: https://script.google.com/macros/s/xxxxxx/exec
 API_KEY = os.getenv("MESSAGES_API_KEY")  # 必要なら
 
+# 1リクエストあたりの制限時間（秒）
+REQUEST_TIMEOUT = float(os.getenv("MESSAGES_API_TIMEOUT", "10"))
+
+# Bot全体で共有するHTTPセッション（configure()で設定、未設定なら初回に作成）
+_session = None
+_owns_session = False
+
+
+def configure(session):
+    """
+    共有のHTTPセッションを設定
+
+    Args:
+        session (aiohttp.ClientSession): Botが所有するHTTPセッション
+    """
+    global _session, _owns_session
+    _session = session
+    _owns_session = False
+
+
+async def close():
+    """自分で作成したHTTPセッションを閉じる（共有セッションは閉じない）"""
+    global _session
+    if _owns_session and _session and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def _get_session():
+    """HTTPセッションを取得（共有セッションが無ければ作成）"""
+    global _session, _owns_session
+    if _session is None or _session.closed:
+        _session = create_http_session()
+        _owns_session = True
+    return _session
+
+
+async def _request(method, timeout=None, **kwargs):
+    """
+    メッセージAPIにリクエストを送信
+
+    Returns:
+        tuple: (ステータスコード, JSON応答（解析できなければNone）)
+    """
+    timeout = aiohttp.ClientTimeout(total=timeout or REQUEST_TIMEOUT)
+    try:
+        async with _get_session().request(method, API_URL, timeout=timeout, **kwargs) as r:
+            try:
+                data = await r.json(content_type=None)
+            except Exception:
+                data = None
+            return r.status, data
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"メッセージAPIの応答がタイムアウトしました（{timeout.total}秒）")
+
+
 # --- 基本関数 ---
-def get_message(key):
+async def get_message(key, timeout=None):
     """指定キーのメッセージを取得"""
     params = {"key": key}
     if API_KEY:
         params["api_key"] = API_KEY
-    r = requests.get(API_URL, params=params)
-    if r.status_code == 200:
-        return r.json()
+    status, data = await _request("GET", timeout, params=params)
+    if status == 200:
+        return data
     return None
 
-def get_all_messages():
+async def get_all_messages(timeout=None):
     """全メッセージ一覧を取得"""
+    try:
+        return await fetch_all_messages(timeout)
+    except RuntimeError:
+        return []
+
+async def fetch_all_messages(timeout=None):
+    """全メッセージ一覧を取得（取得できなかった場合は空リストと区別するため例外を送出）"""
     params = {}
     if API_KEY:
         params["api_key"] = API_KEY
-    r = requests.get(API_URL, params=params)
-    if r.status_code == 200:
-        try:
-            return r.json()
-        except Exception:
-            return []
-    return []
-
-def add_or_update_message(key, content, embed=None):
-    """新規追加または更新（POST）"""
+    status, data = await _request("GET", timeout, params=params)
+    if status != 200 or not isinstance(data, list):
+        raise RuntimeError(f"メッセージ一覧の取得に失敗しました（HTTP {status}）")
+    return data
+
+async def add_or_update_message(key, content, embed=None, timeout=None, updated_at=None):
+    """新規追加または更新（POST）。updated_at（UNIX時刻）を指定した場合はISO形式で一緒に送る"""
     data = {
         "key": key,
         "content": content,
@@ -41,15 +105,17 @@ def add_or_update_message(key, content, embed=None):
         "embed_description": embed["description"] if embed and "description" in embed else "",
         "embed_color": embed["color"] if embed and "color" in embed else ""
     }
+    if updated_at is not None:
+        data["updated_at"] = datetime.fromtimestamp(updated_at, timezone.utc).isoformat()
     if API_KEY:
         data["api_key"] = API_KEY
-    r = requests.post(API_URL, json=data)
-    return r.status_code == 200
+    status, _ = await _request("POST", timeout, json=data)
+    return status == 200
 
-def remove_message(key):
+async def remove_message(key, timeout=None):
     """メッセージ削除（DELETE）"""
     params = {"key": key}
     if API_KEY:
         params["api_key"] = API_KEY
-    r = requests.delete(API_URL, params=params)
-    return r.status_code == 200
+    status, _ = await _request("DELETE", timeout, params=params)
+    return status == 200
@@ -0,0 +1,122 @@
+"""
+数式通知の送信済み状態（ウォーターマーク）を保存するローカルストア
+最後に通知した数式の登録時刻と、その付近で通知済みのドキュメントIDをJSONファイルに記録する
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+# 状態ファイルの保存先
+STATE_PATH = os.getenv('NOTIFICATION_STATE_PATH', 'data/notification_state.json')
+
+# ウォーターマークより古い通知済みIDを保持しておく期間
+# （後から書き込まれた古い登録時刻の数式も、この期間だけさかのぼってIDで確認する）
+ANNOUNCED_ID_RETENTION = timedelta(days=2)
+
+
+class NotificationState:
+    def __init__(self, path=STATE_PATH):
+        """
+        状態ファイルを読み込む（存在しなければ空の状態で開始）
+
+        Args:
+            path (str): 状態ファイルのパス
+        """
+        self.path = path
+        # 通知済みの最新の登録時刻
+        self.last_timestamp = None
+        # ドキュメントID -> 登録時刻（同時刻の数式を二重通知しないため）
+        self.announced = {}
+        # 最後に定期通知を実行した日付（JST, YYYY-MM-DD）
+        self.last_run_date = None
+        self.load()
+
+    def load(self):
+        """状態ファイルを読み込む"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"通知状態の読み込みエラー: {e}")
+            return
+
+        if data.get('last_timestamp'):
+            self.last_timestamp = datetime.fromisoformat(data['last_timestamp'])
+        self.announced = {
+            doc_id: datetime.fromisoformat(timestamp)
+            for doc_id, timestamp in data.get('announced', {}).items()
+        }
+        self.last_run_date = data.get('last_run_date')
+
+    def save(self):
+        """状態ファイルを書き込む（一時ファイルに書いてから置き換える）"""
+        data = {
+            'last_timestamp': self.last_timestamp.isoformat() if self.last_timestamp else None,
+            'announced': {doc_id: timestamp.isoformat() for doc_id, timestamp in self.announced.items()},
+            'last_run_date': self.last_run_date,
+        }
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"通知状態の保存エラー: {e}")
+
+    def lookback_start(self):
+        """
+        後から書き込まれた数式を探し始める時刻（ウォーターマーク未設定ならNone）
+
+        登録時刻がウォーターマークより前でも後から書き込まれる数式があるため、
+        ウォーターマークから ANNOUNCED_ID_RETENTION だけさかのぼる（この範囲の通知済みIDは保持されている）。
+        """
+        if self.last_timestamp is None:
+            return None
+        return self.last_timestamp - ANNOUNCED_ID_RETENTION
+
+    def is_announced(self, doc_id):
+        """通知済みのドキュメントならTrue"""
+        return doc_id in self.announced
+
+    def mark_announced(self, formulas):
+        """
+        数式を通知済みとして記録して保存
+
+        ウォーターマークは進めないため、新しい順に送信している途中で止まっても
+        古い未送信の数式は次回の対象に残る。
+
+        Args:
+            formulas (list): 通知した数式データのリスト
+        """
+        for formula_data in formulas:
+            timestamp = formula_data.get('timestamp')
+            if hasattr(timestamp, 'isoformat'):
+                self.announced[formula_data['id']] = timestamp
+        self.save()
+
+    def advance_watermark(self):
+        """通知済みの数式のうち最新の登録時刻までウォーターマークを進めて保存"""
+        if self.announced:
+            latest = max(self.announced.values())
+            if self.last_timestamp is None or latest > self.last_timestamp:
+                self.last_timestamp = latest
+
+        # ウォーターマークより十分古いIDは以降のクエリに出てこないので捨てる
+        if self.last_timestamp is not None:
+            threshold = self.last_timestamp - ANNOUNCED_ID_RETENTION
+            self.announced = {
+                doc_id: timestamp for doc_id, timestamp in self.announced.items()
+                if timestamp >= threshold
+            }
+        self.save()
+
+    def mark_run(self, run_date):
+        """定期通知を実行した日付を記録して保存"""
+        self.last_run_date = run_date
+        self.save()
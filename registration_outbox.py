@@ -0,0 +1,206 @@
+"""
+数式登録申請の送信待ちキュー（アウトボックス）
+登録申請をSQLiteに保存してから、バックグラウンドでGASへ送信・再試行する
+（Botの再起動やGASの障害があっても申請が失われないようにする）
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+# アウトボックスの保存先
+OUTBOX_PATH = os.getenv('REGISTRATION_OUTBOX_PATH', 'data/registration_outbox.sqlite3')
+
+# 再試行の間隔（秒）: 初回 BACKOFF_BASE 秒から倍々に伸ばし、BACKOFF_MAX 秒で頭打ち
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+# この回数失敗したら諦める
+MAX_ATTEMPTS = 12
+# 送信済みの申請を残しておく期間（秒）
+SENT_RETENTION = 7 * 24 * 60 * 60
+
+# 申請の状態
+STATUS_PENDING = 'pending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    user_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+def backoff_delay(attempts):
+    """
+    失敗回数に応じた次の再試行までの秒数（ジッター付き）
+
+    Args:
+        attempts (int): これまでの失敗回数（1以上）
+    """
+    delay = min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class OutboxEntry:
+    __slots__ = ('id', 'idempotency_key', 'payload', 'user_id', 'status', 'attempts', 'last_error', 'result')
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.idempotency_key = row['idempotency_key']
+        self.payload = json.loads(row['payload'])
+        self.user_id = row['user_id']
+        self.status = row['status']
+        self.attempts = row['attempts']
+        self.last_error = row['last_error']
+        self.result = json.loads(row['result']) if row['result'] else None
+
+
+class RegistrationOutbox:
+    def __init__(self, path=OUTBOX_PATH):
+        """
+        アウトボックスを開く（ファイルが無ければ作成）
+
+        メソッドは同期的にSQLiteへアクセスするため、イベントループからは asyncio.to_thread 経由で呼び出す。
+        送信タスクとボタン操作から同時に呼ばれても1つずつ実行されるよう、内部でロックする。
+
+        Args:
+            path (str): SQLiteファイルのパス
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.RLock()
+
+    def close(self):
+        """データベースを閉じる"""
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, payload, idempotency_key, user_id=None):
+        """
+        登録申請を保存
+
+        同じ冪等キーの申請が既にあれば新しく追加せず、その申請を返す。
+
+        Args:
+            payload (dict): 登録する数式データ
+            idempotency_key (str): 申請ごとの一意なキー（GASにも送って二重登録を防ぐ）
+            user_id (int): 申請したユーザーのID
+
+        Returns:
+            OutboxEntry: 保存された申請
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(idempotency_key, payload, user_id, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (idempotency_key, json.dumps(payload, ensure_ascii=False), user_id, now, now, now)
+            )
+        return self.get_by_key(idempotency_key)
+
+    def get(self, entry_id):
+        """受付番号から申請を取得（無ければNone）"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM outbox WHERE id = ?", (entry_id,)).fetchone()
+        return OutboxEntry(row) if row else None
+
+    def get_by_key(self, idempotency_key):
+        """冪等キーから申請を取得（無ければNone）"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM outbox WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+        return OutboxEntry(row) if row else None
+
+    def due(self, limit=20):
+        """
+        送信時刻を過ぎた未送信の申請を古い順に取得
+
+        Args:
+            limit (int): 最大件数
+
+        Returns:
+            list: OutboxEntry のリスト
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM outbox WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (STATUS_PENDING, time.time(), limit)
+            ).fetchall()
+        return [OutboxEntry(row) for row in rows]
+
+    def mark_sent(self, entry_id, result):
+        """申請を送信済みにする"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, result = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                (STATUS_SENT, json.dumps(result, ensure_ascii=False), time.time(), entry_id)
+            )
+
+    def mark_retry(self, entry_id, error):
+        """
+        送信失敗を記録して次の再試行時刻を設定
+
+        Args:
+            entry_id (int): 受付番号
+            error (str): エラー内容
+
+        Returns:
+            bool: 再試行する場合はTrue、試行回数の上限に達して諦めた場合はFalse
+        """
+        entry = self.get(entry_id)
+        if entry is None:
+            return False
+        attempts = entry.attempts + 1
+        now = time.time()
+        status = STATUS_PENDING if attempts < MAX_ATTEMPTS else STATUS_FAILED
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? "
+                "WHERE id = ?",
+                (status, attempts, now + backoff_delay(attempts), str(error), now, entry_id)
+            )
+        return status == STATUS_PENDING
+
+    def purge_sent(self, retention=SENT_RETENTION):
+        """保存期間を過ぎた送信済みの申請を削除"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM outbox WHERE status = ? AND updated_at < ?",
+                (STATUS_SENT, time.time() - retention)
+            )
+
+    def counts(self):
+        """状態ごとの件数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def stats(self):
+        """状況を文字列で取得"""
+        counts = self.counts()
+        return (
+            f"送信待ち: {counts.get(STATUS_PENDING, 0)} | 送信済み: {counts.get(STATUS_SENT, 0)} | "
+            f"失敗: {counts.get(STATUS_FAILED, 0)}"
+        )
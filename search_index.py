@@ -0,0 +1,199 @@
+"""
+数式検索用の転置インデックス
+タイトル・英語タイトル・タグ名・数式タイプをトークン化して保持し、スコア順に検索する
+（日本語は文字bi-gramと1文字検索用のuni-gram、英数字は単語と前方一致用の部分文字列で索引化）
+"""
+
+import math
+import re
+import threading
+import unicodedata
+
+# フィールドごとの重み
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'title_EN': 3.0,
+    'tags': 2.0,
+    'formula_type': 1.5,
+}
+
+# 英単語の前方一致トークンに掛ける係数
+PREFIX_WEIGHT = 0.5
+# 2文字以上続くCJK文字の1文字トークン（1文字での検索用）に掛ける係数
+CJK_UNIGRAM_WEIGHT = 0.5
+
+# 英数字の連続とCJK文字（ひらがな・カタカナ・漢字）の連続
+_WORD_RE = re.compile(r'[0-9a-z]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+
+def _normalize(text):
+    """全角・半角を揃えて小文字化"""
+    return unicodedata.normalize('NFKC', str(text)).lower()
+
+
+def tokenize(text, prefixes=False):
+    """
+    テキストをトークンに分割
+
+    Args:
+        text (str): 対象テキスト
+        prefixes (bool): 英単語の前方一致用トークン（2文字以上）と
+            CJK文字の1文字トークンも生成する（索引側で使用）
+
+    Returns:
+        list: (トークン, 重み係数) のリスト
+    """
+    tokens = []
+    for word in _WORD_RE.findall(_normalize(text)):
+        if word.isascii():
+            tokens.append((word, 1.0))
+            if prefixes:
+                for end in range(2, len(word)):
+                    tokens.append((word[:end], PREFIX_WEIGHT))
+        elif len(word) == 1:
+            tokens.append((word, 1.0))
+        else:
+            # CJKは文字bi-gram
+            for i in range(len(word) - 1):
+                tokens.append((word[i:i + 2], 1.0))
+            if prefixes:
+                # 1文字のクエリ（例: 「円」）が語の途中にも一致するように
+                for char in word:
+                    tokens.append((char, CJK_UNIGRAM_WEIGHT))
+    return tokens
+
+
+class FormulaSearchIndex:
+    def __init__(self):
+        """空の転置インデックスを作成"""
+        # トークン -> {ドキュメントID: スコア}
+        self._postings = {}
+        # ドキュメントID -> 登録済みトークンの集合（削除用）
+        self._doc_tokens = {}
+        # タグID -> ドキュメントIDの集合（タグでの絞り込み用）
+        self._tag_docs = {}
+        # ドキュメントID -> (タグIDの集合, 登録日時)
+        self._doc_meta = {}
+        # ミラーのリスナースレッドからも更新されるためロックで保護する
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_tokens
+
+    def update(self, doc_id, formula_data, tag_names):
+        """
+        ドキュメントを登録（既に登録済みなら置き換え）
+
+        Args:
+            doc_id (str): ドキュメントID
+            formula_data (dict): 数式データ（title, title_EN, formula_type, tags, timestamp を使用）
+            tag_names (list): タグ名のリスト
+        """
+        formula_types = formula_data.get('formula_type') or []
+        if isinstance(formula_types, str):
+            formula_types = formula_types.split(',')
+
+        fields = {
+            'title': formula_data.get('title', ''),
+            'title_EN': formula_data.get('title_EN', ''),
+            'tags': ' '.join(str(name) for name in tag_names),
+            'formula_type': ' '.join(str(t) for t in formula_types),
+        }
+
+        scores = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for token, factor in tokenize(text, prefixes=True):
+                scores[token] = scores.get(token, 0.0) + weight * factor
+
+        tag_ids = {str(tag_id) for tag_id in formula_data.get('tags') or []}
+
+        with self._lock:
+            self._remove(doc_id)
+            for token, score in scores.items():
+                self._postings.setdefault(token, {})[doc_id] = score
+            self._doc_tokens[doc_id] = set(scores)
+            for tag_id in tag_ids:
+                self._tag_docs.setdefault(tag_id, set()).add(doc_id)
+            self._doc_meta[doc_id] = (tag_ids, formula_data.get('timestamp'))
+
+    def remove(self, doc_id):
+        """ドキュメントを削除"""
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        """ドキュメントを削除（ロック取得済みで呼ぶこと）"""
+        for token in self._doc_tokens.pop(doc_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+        tag_ids, _ = self._doc_meta.pop(doc_id, ((), None))
+        for tag_id in tag_ids:
+            docs = self._tag_docs.get(tag_id)
+            if docs is not None:
+                docs.discard(doc_id)
+                if not docs:
+                    del self._tag_docs[tag_id]
+
+    def search(self, query, limit=None, tag_id=None):
+        """
+        クエリに一致するドキュメントIDをスコア順に取得
+
+        全てのクエリトークンを含むドキュメントを優先し、
+        1件もなければいずれかのトークンを含むドキュメントを返す。
+        タグIDを指定した場合はそのタグが付いた数式に絞り込み、
+        クエリが空なら登録日時の新しい順に返す。
+
+        Args:
+            query (str): 検索クエリ
+            limit (int): 最大件数（Noneなら全件）
+            tag_id (str): 絞り込むタグID
+
+        Returns:
+            list: ドキュメントIDのリスト
+        """
+        query_tokens = {token for token, _ in tokenize(query or '')}
+        if tag_id is not None:
+            tag_id = str(tag_id)
+            with self._lock:
+                tagged = set(self._tag_docs.get(tag_id, ()))
+                if not query_tokens:
+                    timestamps = {doc_id: self._doc_meta[doc_id][1] for doc_id in tagged}
+                    candidates = sorted(
+                        tagged,
+                        key=lambda doc_id: (timestamps[doc_id] is not None, timestamps[doc_id]),
+                        reverse=True
+                    )
+                    return candidates[:limit] if limit else candidates
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            total = max(len(self._doc_tokens), 1)
+            scores = {}
+            matches = {}
+            for token in query_tokens:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + total / len(postings))
+                for doc_id, score in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score * idf
+                    matches[doc_id] = matches.get(doc_id, 0) + 1
+
+        if tag_id is not None:
+            matches = {doc_id: count for doc_id, count in matches.items() if doc_id in tagged}
+
+        required = len(query_tokens)
+        candidates = [doc_id for doc_id, count in matches.items() if count == required]
+        if not candidates:
+            candidates = list(matches)
+
+        candidates.sort(key=lambda doc_id: scores[doc_id], reverse=True)
+        return candidates[:limit] if limit else candidates
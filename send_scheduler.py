@@ -0,0 +1,280 @@
+"""
+Botの送信処理（メッセージ送信・編集・フォローアップ）をまとめて制御するスケジューラー
+チャンネル・ルートごとのトークンバケットでレート制限を守りつつ、優先度順に送信する
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+# 優先度（小さいほど先に送信）
+PRIORITY_INTERACTIVE = 0  # コマンドへの応答
+PRIORITY_NORMAL = 5       # 通常の送信
+PRIORITY_BULK = 10        # 定期通知などの一括送信
+
+# ルート種別ごとのレート (回数, 秒)
+ROUTE_LIMITS = {
+    'channel': (5, 5.0),   # チャンネルへの送信・編集
+    'webhook': (5, 2.0),   # インタラクションのフォローアップ
+}
+# Bot全体のレート (回数, 秒)
+GLOBAL_LIMIT = (50, 1.0)
+
+# 同時に待機できる一括送信の数（超えると送信側が待たされる）
+MAX_PENDING_BULK = 50
+# 送信ワーカーの数
+WORKER_COUNT = 4
+# 保持するトークンバケット数の目安（超えたら満タンのものを破棄）
+MAX_BUCKETS = 1000
+
+
+class TokenBucket:
+    def __init__(self, count, per):
+        """
+        トークンバケットを初期化
+
+        Args:
+            count (int): per秒あたりの回数（バケット容量）
+            per (float): 秒数
+        """
+        self.capacity = count
+        self.rate = count / per
+        self._tokens = float(count)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        トークンを1つ消費
+
+        Returns:
+            float: 0ならすぐ送信可能。それ以外はトークンが貯まるまでの待ち秒数（消費しない）
+        """
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    @property
+    def full(self):
+        self._refill()
+        return self._tokens >= self.capacity
+
+
+class _SendJob:
+    __slots__ = ('route', 'func', 'future', 'coalesce_key', 'bulk')
+
+    def __init__(self, route, func, future, coalesce_key, bulk):
+        self.route = route
+        self.func = func
+        self.future = future
+        self.coalesce_key = coalesce_key
+        self.bulk = bulk
+
+
+class SendScheduler:
+    def __init__(self, workers=WORKER_COUNT, max_pending_bulk=MAX_PENDING_BULK):
+        """送信スケジューラーを初期化（start()で送信ワーカーを開始）"""
+        self._queue = asyncio.PriorityQueue()
+        self._bulk_slots = asyncio.Semaphore(max_pending_bulk)
+        self._buckets = {}
+        self._global_bucket = TokenBucket(*GLOBAL_LIMIT)
+        self._pending_coalesce = {}
+        # 送信中のルートと、その完了を待っているジョブ（同じルートは順番通りに1件ずつ送る）
+        self._busy_routes = set()
+        self._route_waiting = {}
+        # 結果がまだ出ていないジョブ（停止時にまとめてキャンセルする）
+        self._jobs = set()
+        self._counter = itertools.count()
+        self._worker_count = workers
+        self._workers = []
+        self._stopped = False
+
+        # メトリクス
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.deferred = 0
+
+    def start(self):
+        """送信ワーカーを開始"""
+        if self._workers:
+            return
+        self._stopped = False
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._worker_count)]
+
+    async def stop(self):
+        """送信ワーカーを停止し、未送信のジョブをキャンセルする（待っている呼び出し元には CancelledError）"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._stopped = True
+
+        # キュー・ルート待ち・延期中（call_later）のジョブをすべて破棄
+        for job in self._jobs:
+            job.future.cancel()
+            if job.bulk:
+                self._bulk_slots.release()
+        self._jobs.clear()
+        self._queue = asyncio.PriorityQueue()
+        self._route_waiting.clear()
+        self._busy_routes.clear()
+        self._pending_coalesce.clear()
+
+    # --- 送信API ---
+
+    async def send(self, channel, content=None, *, priority=PRIORITY_NORMAL, coalesce_key=None, **kwargs):
+        """channel.send をスケジュールして結果のメッセージを返す"""
+        if content is not None:
+            kwargs['content'] = content
+        return await self.submit(
+            f"channel:{channel.id}",
+            lambda: channel.send(**kwargs),
+            priority=priority,
+            coalesce_key=coalesce_key
+        )
+
+    async def edit(self, message, *, priority=PRIORITY_NORMAL, **kwargs):
+        """
+        message.edit をスケジュール
+
+        同じメッセージへの未送信の編集は最新の内容にまとめられる。
+        """
+        return await self.submit(
+            f"channel:{message.channel.id}",
+            lambda: message.edit(**kwargs),
+            priority=priority,
+            coalesce_key=f"edit:{message.id}"
+        )
+
+    async def followup(self, interaction, content=None, *, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """interaction.followup.send をスケジュールして結果のメッセージを返す"""
+        if content is not None:
+            kwargs['content'] = content
+        return await self.submit(
+            f"webhook:{interaction.id}",
+            lambda: interaction.followup.send(**kwargs),
+            priority=priority
+        )
+
+    async def submit(self, route, func, *, priority=PRIORITY_NORMAL, coalesce_key=None):
+        """
+        送信処理をキューに入れて完了を待つ
+
+        Args:
+            route (str): レート制限のルートキー（例: "channel:123"）
+            func: 送信処理を行うコルーチンを返す関数
+            priority (int): 優先度（小さいほど先）
+            coalesce_key (str): 同じキーの未送信ジョブがあれば内容を置き換えてまとめる
+
+        Returns:
+            送信処理の結果
+        """
+        if coalesce_key is not None:
+            job = self._pending_coalesce.get(coalesce_key)
+            if job is not None:
+                job.func = func
+                self.coalesced += 1
+                return await asyncio.shield(job.future)
+
+        bulk = priority >= PRIORITY_BULK
+        if bulk:
+            # 一括送信が溜まりすぎている場合はここで待たせる（バックプレッシャー）
+            await self._bulk_slots.acquire()
+        if self._stopped:
+            if bulk:
+                self._bulk_slots.release()
+            raise RuntimeError("送信スケジューラーは停止しています")
+
+        job = _SendJob(route, func, asyncio.get_running_loop().create_future(), coalesce_key, bulk)
+        self._jobs.add(job)
+        if coalesce_key is not None:
+            self._pending_coalesce[coalesce_key] = job
+        self._queue.put_nowait((priority, next(self._counter), job))
+        return await asyncio.shield(job.future)
+
+    # --- 内部処理 ---
+
+    def _bucket(self, route):
+        """ルートに対応するトークンバケットを取得"""
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._buckets = {key: b for key, b in self._buckets.items() if not b.full}
+            kind = route.split(':', 1)[0]
+            bucket = TokenBucket(*ROUTE_LIMITS.get(kind, ROUTE_LIMITS['channel']))
+            self._buckets[route] = bucket
+        return bucket
+
+    async def _worker(self):
+        """キューから優先度順にジョブを取り出して送信"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            priority, _, job = item
+            if job not in self._jobs:
+                # 停止時にキャンセル済み（延期中に停止した場合など）
+                continue
+
+            # 同じルートの送信中ジョブがあれば、その完了後に回す
+            if job.route in self._busy_routes:
+                heapq.heappush(self._route_waiting.setdefault(job.route, []), item)
+                continue
+
+            # ルートのトークンが足りなければ後で戻し、他のルートのジョブを先に処理する
+            wait = self._bucket(job.route).acquire()
+            if wait > 0:
+                self.deferred += 1
+                loop.call_later(wait, self._queue.put_nowait, item)
+                continue
+
+            wait = self._global_bucket.acquire()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._global_bucket.acquire()
+
+            if job.coalesce_key is not None and self._pending_coalesce.get(job.coalesce_key) is job:
+                del self._pending_coalesce[job.coalesce_key]
+
+            self._busy_routes.add(job.route)
+            try:
+                result = await job.func()
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.sent += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                # 送信中にワーカーが停止された場合も呼び出し元を待たせない
+                if not job.future.done():
+                    job.future.cancel()
+                self._jobs.discard(job)
+                if job.bulk:
+                    self._bulk_slots.release()
+                self._release_route(job.route)
+
+    def _release_route(self, route):
+        """ルートの送信完了後、待っているジョブを優先度順に1件キューへ戻す"""
+        self._busy_routes.discard(route)
+        waiting = self._route_waiting.get(route)
+        if waiting:
+            self._queue.put_nowait(heapq.heappop(waiting))
+            if not waiting:
+                del self._route_waiting[route]
+
+    def stats(self):
+        """メトリクスを文字列で取得"""
+        return (
+            f"待機: {self._queue.qsize()} | 送信: {self.sent} | 失敗: {self.failed} | "
+            f"統合: {self.coalesced} | 延期: {self.deferred}"
+        )
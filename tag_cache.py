@@ -0,0 +1,129 @@
+"""
+GASのタグリストのキャッシュ
+最後に取得できたタグリストをカタログとして即座に返し、TTLを過ぎたらバックグラウンドで再取得する
+"""
+
+import asyncio
+import os
+import time
+
+from tag_catalog import TagCatalog
+
+# タグリストを新鮮とみなす秒数（過ぎると古いデータを返しつつ裏で再取得する）
+TAG_CACHE_TTL = int(os.getenv('GAS_TAG_CACHE_TTL', '600'))
+
+
+class TagCache:
+    def __init__(self, fetcher, ttl=TAG_CACHE_TTL):
+        """
+        タグキャッシュを初期化
+
+        Args:
+            fetcher: タグリスト（list）を返すコルーチン関数（例: GASClient.get_tags_list）
+            ttl (float): キャッシュを新鮮とみなす秒数
+        """
+        self._fetcher = fetcher
+        self.ttl = ttl
+        self._catalog = None
+        self._fetched_at = 0.0
+        # invalidate() 後は次の get() で再取得を待つ
+        self._valid = False
+        # 実行中の取得タスク（同時のミスは1回の取得にまとめる）
+        self._inflight = None
+        # タグリストが入れ替わるたびに増える
+        self.version = 0
+
+        # メトリクス
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    @property
+    def loaded(self):
+        """有効なタグリストを保持していればTrue"""
+        return self._catalog is not None and self._valid
+
+    @property
+    def expired(self):
+        """TTLを過ぎていればTrue"""
+        return time.monotonic() - self._fetched_at >= self.ttl
+
+    @property
+    def catalog(self):
+        """キャッシュ済みのタグカタログ（未取得なら空のカタログ）"""
+        return self._catalog or TagCatalog([])
+
+    async def get(self):
+        """
+        タグリストを取得
+
+        キャッシュがあればそのまま返し、TTL切れなら裏で再取得を始める。
+        キャッシュが無い（または破棄された）場合は取得完了まで待つ。
+
+        Returns:
+            TagCatalog: タグカタログ（取得できなければ空のカタログ）
+        """
+        if self.loaded:
+            self.hits += 1
+            if self.expired:
+                self.prefetch()
+            return self._catalog
+
+        self.misses += 1
+        return await asyncio.shield(self.prefetch())
+
+    def prefetch(self):
+        """
+        タグリストの取得をバックグラウンドで開始（既に取得中ならそのタスクを返す）
+
+        Returns:
+            asyncio.Task: 取得タスク（結果はタグカタログ）
+        """
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._refresh())
+        return self._inflight
+
+    def invalidate(self):
+        """キャッシュを破棄して再取得を開始（新しいタグが登録されたときに呼ぶ）"""
+        self._valid = False
+        try:
+            self.prefetch()
+        except RuntimeError:
+            # イベントループ外では次の get() で取得する
+            pass
+
+    def contains(self, tag_ids_str):
+        """
+        タグIDがすべてキャッシュ済みのタグリストに含まれていればTrue
+
+        Args:
+            tag_ids_str (str): タグIDのカンマ区切り文字列
+        """
+        if self._catalog is None:
+            return False
+        return self._catalog.contains(tag_ids_str)
+
+    async def _refresh(self):
+        """タグリストを取得してキャッシュを更新（失敗時は前回のデータを残す）"""
+        self.refreshes += 1
+        try:
+            data = await self._fetcher()
+        except Exception as e:
+            print(f"タグリスト更新エラー: {e}")
+            data = None
+
+        if data:
+            # タグリストの版ごとにカタログ（ID・名前の索引）を1回だけ作る
+            self.version += 1
+            self._catalog = TagCatalog(data, self.version)
+            self._fetched_at = time.monotonic()
+            self._valid = True
+        elif self._catalog is not None:
+            # 取得に失敗しても前回のデータで応答を続ける（すぐに再試行しないよう時刻だけ進める）
+            self._fetched_at = time.monotonic()
+            self._valid = True
+        return self.catalog
+
+    def stats(self):
+        """メトリクスを文字列で取得"""
+        return f"タグ: {len(self.catalog)}件 | ヒット: {self.hits} | ミス: {self.misses} | 取得: {self.refreshes}"
@@ -0,0 +1,178 @@
+"""
+GASのタグリストをまとめて扱うカタログ
+タグリスト1版ごとに1回だけ作成し、ID・名前・番号からの参照と選択入力の解析を提供する
+"""
+
+import re
+
+from embed_layout import MAX_FIELD_VALUE_LENGTH, split_text
+from tag_index import TagIndex, normalize
+
+# 「なし」と入力された場合はタグなし
+NO_TAGS_INPUTS = ('なし', 'none')
+
+# 番号の範囲指定（例: 1-5）
+_RANGE_RE = re.compile(r'^(\d+)\s*[-~〜]\s*(\d+)$')
+
+
+class TagCatalog:
+    def __init__(self, tags, version=0):
+        """
+        タグリストからカタログを作成
+
+        Args:
+            tags (list): タグ情報の辞書のリスト（表示順 = 番号順）
+            version (int): タグリストの版（TagCache.version）
+        """
+        self.tags = tuple(tags)
+        self.version = version
+        # タグID -> (番号, タグ情報)
+        self._by_id = {}
+        # 正規化したタグ名 -> タグID
+        self._by_name = {}
+        for ordinal, tag in enumerate(self.tags, 1):
+            tag_id = self.tag_id(tag, ordinal)
+            self._by_id.setdefault(tag_id, (ordinal, tag))
+            for field in ('tagName', 'tagName_EN'):
+                name = normalize(tag.get(field) or '')
+                if name:
+                    self._by_name.setdefault(name, tag_id)
+        self._index = None
+
+    @classmethod
+    def of(cls, tags):
+        """タグリストをカタログに変換（既にカタログならそのまま返す）"""
+        return tags if isinstance(tags, cls) else cls(tags or [])
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __iter__(self):
+        return iter(self.tags)
+
+    @staticmethod
+    def tag_id(tag, ordinal):
+        """タグのIDを文字列で取得（IDが無ければ番号を使う）"""
+        return str(tag.get('tagID', ordinal))
+
+    @property
+    def index(self):
+        """タグ名の検索インデックス（初回アクセス時に作成）"""
+        if self._index is None:
+            self._index = TagIndex(self.tags)
+        return self._index
+
+    def get(self, tag_id):
+        """タグIDからタグ情報を取得（見つからなければNone）"""
+        entry = self._by_id.get(str(tag_id).strip())
+        return entry[1] if entry else None
+
+    def by_ordinal(self, ordinal):
+        """表示番号（1始まり）からタグ情報を取得（範囲外ならNone）"""
+        if 1 <= ordinal <= len(self.tags):
+            return self.tags[ordinal - 1]
+        return None
+
+    def find_by_name(self, name):
+        """タグ名（日本語・英語、全角半角・大文字小文字は区別しない）からタグIDを取得"""
+        return self._by_name.get(normalize(name))
+
+    def contains(self, tag_ids_str):
+        """タグIDのカンマ区切り文字列がすべてカタログに含まれていればTrue"""
+        return all(
+            tag_id.strip() in self._by_id
+            for tag_id in str(tag_ids_str).split(',') if tag_id.strip()
+        )
+
+    def parse_selection(self, user_input):
+        """
+        ユーザーの入力をタグIDのリストに変換
+
+        番号（例: 3）、番号の範囲（例: 1-5）、タグ名をカンマ区切りで指定できる。
+        範囲外の番号や見つからない名前は無視し、重複は1つにまとめる。
+
+        Args:
+            user_input (str): ユーザーの入力（例: "1-5, 9"）
+
+        Returns:
+            list: タグIDのリスト
+        """
+        text = normalize(user_input or '')
+        if not text or text in NO_TAGS_INPUTS:
+            return []
+
+        tag_ids = []
+        seen = set()
+
+        def add(tag_id):
+            if tag_id is not None and tag_id not in seen:
+                seen.add(tag_id)
+                tag_ids.append(tag_id)
+
+        for part in re.split(r'[,、]', text):
+            part = part.strip()
+            if not part:
+                continue
+            if part.isdigit():
+                ordinal = int(part)
+                tag = self.by_ordinal(ordinal)
+                if tag is not None:
+                    add(self.tag_id(tag, ordinal))
+                continue
+            match = _RANGE_RE.match(part)
+            if match:
+                start, end = sorted((int(match.group(1)), int(match.group(2))))
+                for ordinal in range(max(start, 1), min(end, len(self.tags)) + 1):
+                    add(self.tag_id(self.tags[ordinal - 1], ordinal))
+                continue
+            add(self.find_by_name(part))
+
+        return tag_ids
+
+    def names(self, tag_ids):
+        """
+        タグIDのリストをタグ名のリストに変換
+
+        Args:
+            tag_ids (list): タグIDのリスト
+
+        Returns:
+            list: タグ名のリスト（見つからないIDはそのまま）
+        """
+        names = []
+        for tag_id in tag_ids:
+            tag = self.get(tag_id)
+            names.append(tag.get('tagName', tag_id) if tag else tag_id)
+        return names
+
+    def format_for_display(self, max_per_line=6):
+        """
+        タグ一覧を番号付きで表示用にフォーマット
+
+        Args:
+            max_per_line (int): 1行あたりの最大タグ数
+
+        Returns:
+            str: フォーマットされたタグリスト文字列
+        """
+        if not self.tags:
+            return "利用可能なタグがありません。"
+
+        chips = [f"`{i}. {tag.get('tagName', f'Tag{i}')}`" for i, tag in enumerate(self.tags, 1)]
+        return '\n'.join(
+            ' '.join(chips[start:start + max_per_line])
+            for start in range(0, len(chips), max_per_line)
+        )
+
+    def format_pages(self, limit=MAX_FIELD_VALUE_LENGTH, max_per_line=6):
+        """
+        タグ一覧を行の区切りで上限以内のかたまりに分けてフォーマット
+
+        Args:
+            limit (int): 1かたまりあたりの最大文字数（既定はEmbedフィールドの上限）
+            max_per_line (int): 1行あたりの最大タグ数
+
+        Returns:
+            list: フォーマットされたタグリスト文字列のリスト
+        """
+        return split_text(self.format_for_display(max_per_line), limit)
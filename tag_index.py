@@ -0,0 +1,111 @@
+"""
+タグ名のインメモリ検索インデックス
+tagName / tagName_EN の前方一致とn-gram（2・3文字）で、入力途中のキーワードからタグを探す
+（オートコンプリートや検索付きセレクトメニュー用）
+"""
+
+import unicodedata
+
+# 前方一致で索引化する最大文字数
+MAX_PREFIX_LENGTH = 20
+# n-gram一致で候補に残す最低一致率
+MIN_GRAM_OVERLAP = 0.5
+# Discordのオートコンプリート・セレクトメニューの選択肢の上限
+MAX_CHOICES = 25
+
+# 索引化するフィールド
+NAME_FIELDS = ('tagName', 'tagName_EN')
+
+
+def normalize(text):
+    """全角・半角を揃えて小文字化し、前後の空白を除く"""
+    return unicodedata.normalize('NFKC', str(text)).lower().strip()
+
+
+def _grams(text, n):
+    """文字n-gramの集合"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class TagIndex:
+    def __init__(self, tags):
+        """
+        タグのリストからインデックスを作成
+
+        Args:
+            tags (list): タグ情報の辞書のリスト（tagID, tagName, tagName_EN）
+        """
+        self.tags = list(tags)
+        # 前方一致: 部分文字列 -> {タグ位置: スコア}
+        self._prefixes = {}
+        # 完全一致: 正規化した名前 -> タグ位置の集合
+        self._exact = {}
+        # n-gram -> タグ位置の集合
+        self._grams = {2: {}, 3: {}}
+
+        for position, tag in enumerate(self.tags):
+            for field in NAME_FIELDS:
+                name = normalize(tag.get(field) or '')
+                if not name:
+                    continue
+                self._exact.setdefault(name, set()).add(position)
+                # 名前全体の前方一致を優先し、単語ごとの前方一致も拾う
+                self._add_prefixes(name, position, 2.0)
+                for word in name.split()[1:]:
+                    self._add_prefixes(word, position, 1.5)
+                for n, postings in self._grams.items():
+                    for gram in _grams(name, n):
+                        postings.setdefault(gram, set()).add(position)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def _add_prefixes(self, text, position, score):
+        for end in range(1, min(len(text), MAX_PREFIX_LENGTH) + 1):
+            scores = self._prefixes.setdefault(text[:end], {})
+            if scores.get(position, 0) < score:
+                scores[position] = score
+
+    def search(self, query, limit=MAX_CHOICES):
+        """
+        キーワードに一致するタグを関連度順に取得
+
+        完全一致 > 名前の前方一致 > 単語の前方一致 > n-gramの一致率 の順に並べる。
+        キーワードが空の場合は先頭からlimit件を返す。
+
+        Args:
+            query (str): 入力中のキーワード
+            limit (int): 最大件数
+
+        Returns:
+            list: タグ情報の辞書のリスト
+        """
+        query = normalize(query)
+        if not query:
+            return self.tags[:limit]
+
+        scores = {}
+        for position in self._exact.get(query, ()):
+            scores[position] = 3.0
+        for position, score in self._prefixes.get(query, {}).items():
+            if scores.get(position, 0) < score:
+                scores[position] = score
+
+        # 前方一致だけで足りなければ途中一致（n-gram）で補う
+        if len(scores) < limit and len(query) >= 2:
+            n = 3 if len(query) >= 3 else 2
+            query_grams = _grams(query, n)
+            counts = {}
+            for gram in query_grams:
+                for position in self._grams[n].get(gram, ()):
+                    counts[position] = counts.get(position, 0) + 1
+            for position, count in counts.items():
+                overlap = count / len(query_grams)
+                if overlap >= MIN_GRAM_OVERLAP and position not in scores:
+                    scores[position] = overlap
+
+        ranked = sorted(
+            scores,
+            key=lambda position: (-scores[position], len(str(self.tags[position].get('tagName', ''))), position)
+        )
+        return [self.tags[position] for position in ranked[:limit]]